@@ -1,5 +1,6 @@
+import asyncio
 import requests
-import json
+import httpx
 import logging
 import os
 from typing import Dict, Optional, List
@@ -7,12 +8,26 @@ import google.generativeai as genai
 
 try:
     from src.memory_mcp.config import config
+    from src.memory_mcp.gemini_pool import get_model
+    from src.memory_mcp.http_pool import OLLAMA_KEEP_ALIVE, get_session, get_async_client, warm_up_ollama_model
+    from src.memory_mcp import json_utils
+    from src.memory_mcp.llm_cache import InflightCalls, LLMResponseCache, content_key
 except ImportError:
     from config import config
+    from gemini_pool import get_model
+    from http_pool import OLLAMA_KEEP_ALIVE, get_session, get_async_client, warm_up_ollama_model
+    import json_utils
+    from llm_cache import InflightCalls, LLMResponseCache, content_key
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Stop decoding as soon as the (flat) JSON object closes
+JSON_STOP = ["}\n", "\n\n"]
+
+# Prefill cost grows with prompt length, so conversation context is budgeted
+MAX_CONTEXT_CHARS = 800
+MAX_CONTEXT_MESSAGE_CHARS = 200
+
 
 class ExtractionAgent:
     """
@@ -20,75 +35,144 @@ class ExtractionAgent:
     Takes messages flagged as important by the Monitor Agent and converts them
     into structured fact entries for the memory system.
     """
+
+    # Static instructions, sent as the system prompt so every request shares one cacheable
+    # prefix; category, message and context form the per-call suffix
+    SYSTEM_PROMPT = """Extract a structured fact from a message for a long-term memory system.
+
+Your task:
+1. Identify the main topic (e.g., "User Preferences", "Tech Stack", "Personal Info")
+2. Extract the key information as a concise statement
+3. List any entities mentioned (names, technologies, places, etc.)
+4. Set "category" to the "Message category" value given with the message, copied exactly
+
+Return ONLY valid JSON:
+{
+  "topic": "Brief topic name",
+  "content": "Clear, concise fact statement",
+  "entities": ["entity1", "entity2"],
+  "category": "preference"
+}
+
+Examples:
+- "I prefer dark mode" → {"topic": "UI Preferences", "content": "Prefers dark mode", "entities": ["dark mode"], "category": "preference"}
+- "Project uses FastAPI" → {"topic": "Tech Stack", "content": "Project uses FastAPI", "entities": ["FastAPI"], "category": "project"}"""
     
-    def __init__(self, provider: str = None, model: str = None):
+    def __init__(self, provider: str = None, model: str = None, session: Optional[requests.Session] = None,
+                 aclient: Optional[httpx.AsyncClient] = None, base_dir: Optional[str] = None):
         self.provider = provider or config.get("extraction.provider", "ollama")
         self.model_name = model or config.get("extraction.model", "llama3.1:8b")
         self.ollama_url = config.get("ollama.url", "http://localhost:11434")
+        # Pooled keep-alive session, shareable with the Monitor Agent
+        self.session = session or get_session()
+        self._aclient = aclient
+        self.cache = LLMResponseCache("extraction_cache.json", base_dir=base_dir)
+        self._inflight = InflightCalls()
         
         if self.provider == "google":
             api_key = config.google_api_key
             if not api_key or api_key == "YOUR_GOOGLE_API_KEY":
                 logger.error("Google API Key not found for Extraction Agent")
             else:
-                genai.configure(api_key=api_key)
-                self.google_model = genai.GenerativeModel(self.model_name)
-        
-    def _build_extraction_prompt(self, message: str, category: str, context: Optional[List] = None) -> str:
-        """Build the prompt for fact extraction"""
+                self.google_model = get_model(self.model_name, api_key, system_instruction=self.SYSTEM_PROMPT)
+                # Conflict resolution is free-form text, so it uses the model without the extraction prompt
+                self.google_resolver_model = get_model(self.model_name, api_key)
+        elif config.get("ollama.warm_up", True):
+            # Load the model now (off-thread) instead of on the first message
+            warm_up_ollama_model(self.session, self.ollama_url, self.model_name)
         
+    def _format_context(self, context: Optional[List] = None) -> str:
+        """The trimmed conversation context as it appears in the prompt ("" if none)"""
         context_str = ""
         if context:
             recent = context[-3:]  # Last 3 messages for context
             msgs = []
-            for m in recent:
+            budget = MAX_CONTEXT_CHARS
+            # Newest first, so a long old message never crowds out the latest turn
+            for m in reversed(recent):
                 if isinstance(m, dict):
-                    msgs.append(f"{m.get('role', 'user')}: {m.get('content', '')}")
+                    line = f"{m.get('role', 'user')}: {m.get('content', '')}"
                 else:
-                    msgs.append(str(m))
-            context_str = "\n".join(msgs)
-            context_str = f"\n\nRecent conversation context:\n{context_str}\n"
-        
-        prompt = f"""Extract a structured fact from this message for a long-term memory system.
+                    line = str(m)
+                if len(line) > MAX_CONTEXT_MESSAGE_CHARS:
+                    line = line[:MAX_CONTEXT_MESSAGE_CHARS - 3] + "..."
+                if len(line) > budget:
+                    break
+                msgs.append(line)
+                budget -= len(line)
+            if msgs:
+                context_str = "\n\nRecent conversation context:\n" + "\n".join(reversed(msgs)) + "\n"
+        return context_str
 
-Message category: {category}
-Message: "{message}"{context_str}
-
-Your task:
-1. Identify the main topic (e.g., "User Preferences", "Tech Stack", "Personal Info")
-2. Extract the key information as a concise statement
-3. List any entities mentioned (names, technologies, places, etc.)
+    def _build_extraction_prompt(self, message: str, category: str, context: Optional[List] = None) -> str:
+        """Build the per-call part of the extraction prompt; instructions live in SYSTEM_PROMPT"""
+        return "".join((
+            "Message category: ", category,
+            '\nMessage: "', message, '"', self._format_context(context),
+            # Restate the literal next to the answer; small models otherwise echo the template
+            '\n\nJSON response (with "category": "', category, '"):'
+        ))
+    
+    @property
+    def aclient(self) -> httpx.AsyncClient:
+        """Async client for the running event loop (injected or shared)."""
+        return self._aclient or get_async_client()
 
-Return ONLY valid JSON:
-{{
-  "topic": "Brief topic name",
-  "content": "Clear, concise fact statement",
-  "entities": ["entity1", "entity2"],
-  "category": "{category}"
-}}
+    def _cache_key(self, message: str, category: str, context: Optional[List] = None) -> str:
+        # The context shapes the extraction ("yes, that one"), so the key covers what the prompt sees
+        context_str = self._format_context(context)
+        if not context_str:
+            return content_key(self.model_name, category, message)
+        return content_key(self.model_name, category, message, context_str)
 
-Examples:
-- "I prefer dark mode" → {{"topic": "UI Preferences", "content": "Prefers dark mode", "entities": ["dark mode"], "category": "preference"}}
-- "Project uses FastAPI" → {{"topic": "Tech Stack", "content": "Project uses FastAPI", "entities": ["FastAPI"], "category": "project"}}
+    def _remember(self, key: str, extraction: Dict, message: str, category: str) -> Dict:
+        """Cache a successful extraction; fallbacks are not cached so they get retried."""
+        if extraction != self._default_extraction(message, category):
+            self.cache.put(key, extraction)
+        return extraction
 
-JSON response:"""
-        
-        return prompt
-    
     def extract_facts(self, message: str, category: str, context: Optional[List] = None) -> Dict:
         """
         Extract structured facts from a message.
         """
-        if self.provider == "google":
-            return self._extract_google(message, category, context)
-        else:
-            return self._extract_ollama(message, category, context)
+        key = self._cache_key(message, category, context)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        def call() -> Dict:
+            if self.provider == "google":
+                extraction = self._extract_google(message, category, context)
+            else:
+                extraction = self._extract_ollama(message, category, context)
+            return self._remember(key, extraction, message, category)
+
+        return self._inflight.run_sync(key, call)
+
+    async def extract_facts_async(self, message: str, category: str, context: Optional[List] = None) -> Dict:
+        """
+        Async variant of extract_facts that does not block the event loop.
+        """
+        key = self._cache_key(message, category, context)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        async def call() -> Dict:
+            if self.provider == "google":
+                # The Gemini SDK call blocks; keep it off the event loop
+                extraction = await asyncio.to_thread(self._extract_google, message, category, context)
+            else:
+                extraction = await self._extract_ollama_async(message, category, context)
+            return self._remember(key, extraction, message, category)
+
+        return await self._inflight.run(key, call)
 
     def _extract_google(self, message: str, category: str, context: Optional[List] = None) -> Dict:
         """Extract facts using Google Gemini"""
         try:
             prompt = self._build_extraction_prompt(message, category, context)
-            logger.info(f"Extracting facts via Gemini: {message[:50]}...")
+            logger.info("Extracting facts via Gemini: %.50s...", message)
             
             response = self.google_model.generate_content(
                 prompt,
@@ -100,37 +184,68 @@ JSON response:"""
             )
             
             if response.text:
-                extraction = json.loads(response.text)
+                extraction = json_utils.loads(response.text)
                 return self._validate_extraction(extraction, message, category)
             return self._default_extraction(message, category)
         except Exception as e:
-            logger.error(f"Gemini extraction error: {e}")
+            logger.error("Gemini extraction error: %s", e)
+            return self._default_extraction(message, category)
+
+    def _ollama_request(self, message: str, category: str, context: Optional[List] = None) -> tuple:
+        """(endpoint, serialized body) of an Ollama extraction call"""
+        payload = {
+            "model": self.model_name,
+            "system": self.SYSTEM_PROMPT,
+            "prompt": self._build_extraction_prompt(message, category, context),
+            "stream": False,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+            "options": {"temperature": 0.2, "num_predict": 120, "stop": JSON_STOP},
+            "format": "json"
+        }
+        logger.info("Extracting facts via Ollama: %.50s...", message)
+        return f"{self.ollama_url}/api/generate", json_utils.dumps(payload)
+
+    def _parse_ollama_response(self, response, message: str, category: str, attempt: int) -> Optional[Dict]:
+        """
+        Extraction from an Ollama response: the default one on an HTTP error,
+        None if the model produced no JSON object (worth sampling again).
+        """
+        if response.status_code != 200:
             return self._default_extraction(message, category)
+        result = json_utils.loads(response.content)
+        logger.debug("Ollama eval_count: %s", result.get('eval_count'))
+        extraction = self._parse_json_safe(result.get('response', ''), message, category)
+        if extraction is None:
+            logger.warning("Unparseable Ollama extraction (attempt %s)", attempt + 1)
+        return extraction
 
     def _extract_ollama(self, message: str, category: str, context: Optional[List] = None) -> Dict:
         """Extract facts using Ollama"""
         try:
-            prompt = self._build_extraction_prompt(message, category, context)
-            api_endpoint = f"{self.ollama_url}/api/generate"
-            
-            payload = {
-                "model": self.model_name,
-                "prompt": prompt,
-                "stream": False,
-                "options": {"temperature": 0.2, "num_predict": 200},
-                "format": "json"
-            }
-            
-            logger.info(f"Extracting facts via Ollama: {message[:50]}...")
-            response = requests.post(api_endpoint, json=payload, timeout=60)
-            
-            if response.status_code == 200:
-                result = response.json()
-                response_text = result.get('response', '').strip()
-                return self._parse_json_safe(response_text, message, category)
+            url, body = self._ollama_request(message, category, context)
+            # Malformed JSON is rare in JSON mode but not impossible; sample once more before defaulting
+            for attempt in range(2):
+                response = self.session.post(url, data=body, headers=json_utils.JSON_HEADERS, timeout=60)
+                extraction = self._parse_ollama_response(response, message, category, attempt)
+                if extraction is not None:
+                    return extraction
+            return self._default_extraction(message, category)
+        except Exception as e:
+            logger.error("Ollama extraction error: %s", e)
+            return self._default_extraction(message, category)
+
+    async def _extract_ollama_async(self, message: str, category: str, context: Optional[List] = None) -> Dict:
+        """Extract facts using Ollama over the shared async client"""
+        try:
+            url, body = self._ollama_request(message, category, context)
+            for attempt in range(2):
+                response = await self.aclient.post(url, content=body, headers=json_utils.JSON_HEADERS, timeout=60)
+                extraction = self._parse_ollama_response(response, message, category, attempt)
+                if extraction is not None:
+                    return extraction
             return self._default_extraction(message, category)
         except Exception as e:
-            logger.error(f"Ollama extraction error: {e}")
+            logger.error("Ollama extraction error: %s", e)
             return self._default_extraction(message, category)
 
     async def resolve_conflict(self, new_fact_content: str, existing_fact_content: str) -> str:
@@ -149,26 +264,28 @@ Unified Fact:"""
         
         try:
             if self.provider == "google":
-                response = self.google_model.generate_content(prompt)
+                response = await asyncio.to_thread(self.google_resolver_model.generate_content, prompt)
                 return response.text.strip()
             else:
-                payload = {"model": self.model_name, "prompt": prompt, "stream": False}
-                res = requests.post(f"{self.ollama_url}/api/generate", json=payload, timeout=30)
-                return res.json().get('response', new_fact_content).strip()
+                payload = {"model": self.model_name, "prompt": prompt, "stream": False, "keep_alive": OLLAMA_KEEP_ALIVE}
+                res = await self.aclient.post(f"{self.ollama_url}/api/generate", content=json_utils.dumps(payload),
+                                              headers=json_utils.JSON_HEADERS, timeout=30)
+                return json_utils.loads(res.content).get('response', new_fact_content).strip()
         except Exception as e:
-            logger.error(f"Resolution error: {e}")
+            logger.error("Resolution error: %s", e)
             return new_fact_content
 
-    def _parse_json_safe(self, text: str, message: str, category: str) -> Dict:
-        try:
-            json_start = text.find('{')
-            json_end = text.rfind('}') + 1
-            if json_start >= 0 and json_end > json_start:
-                extraction = json.loads(text[json_start:json_end])
-                return self._validate_extraction(extraction, message, category)
-            return self._default_extraction(message, category)
-        except Exception:
-            return self._default_extraction(message, category)
+    def close(self):
+        """Release pooled HTTP connections and flush (and detach) the response cache."""
+        self.cache.close()
+        self.session.close()
+
+    def _parse_json_safe(self, text: str, message: str, category: str) -> Optional[Dict]:
+        """Validated extraction, or None if the response holds no JSON object"""
+        extraction = json_utils.extract_object(text)
+        if extraction is None:
+            return None
+        return self._validate_extraction(extraction, message, category)
 
     def _validate_extraction(self, extraction: Dict, message: str, category: str) -> Dict:
         required_fields = ["topic", "content", "entities", "category"]
@@ -2,12 +2,37 @@
 Grounding Agent - Retrieves relevant context before chatbot responses
 Uses semantic search and fact retrieval to enrich queries with relevant information
 """
+from collections import defaultdict
 from typing import Dict, List, Optional
 import logging
+import re
+import numpy as np
+
+try:
+    from src.memory_mcp.config import config
+except ImportError:
+    from config import config
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def _normalized(vector) -> np.ndarray:
+    """L2-normalize an embedding as float32"""
+    v = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
+
+
+def _quantize(vector: np.ndarray) -> tuple:
+    """Symmetric int8 quantization; returns (int8 vector, dequantization factor)"""
+    peak = float(np.max(np.abs(vector))) if vector.size else 0.0
+    if peak == 0.0:
+        return np.zeros(vector.shape, dtype=np.int8), 0.0
+    scale = 127.0 / peak
+    return np.round(vector * scale).astype(np.int8), 1.0 / scale
+
 
 class GroundingAgent:
     """
@@ -15,15 +40,111 @@ class GroundingAgent:
     This agent runs before the main chatbot LLM to inject relevant context.
     """
     
-    def __init__(self, memory_store):
+    def __init__(self, memory_store, similarity_threshold: float = None):
         """
         Initialize the Grounding Agent.
         
         Args:
             memory_store: MemoryStore instance for accessing facts and memories
+            similarity_threshold: Minimum cosine similarity for a fact to count as relevant
         """
         self.memory_store = memory_store
-        
+        self.similarity_threshold = similarity_threshold or config.get("grounding.similarity_threshold", 0.5)
+        # Inverted index over the fact sheet, rebuilt when fact_sheet_version changes
+        self._index = None
+        self._index_version = None
+        self._indexed_facts: List[Dict] = []
+        self._max_entity_len = 1
+        # Normalized fact embeddings: topic -> (content, int8 vector, dequant factor),
+        # stacked into an (N, D) int8 matrix with one factor per row (4x smaller than float32)
+        self._embeddings: Dict[str, tuple] = {}
+        self._fact_matrix: Optional[np.ndarray] = None
+        self._fact_scales: Optional[np.ndarray] = None
+        self._matrix_version = None
+
+    def _ensure_index(self):
+        """(Re)build the inverted index when the fact sheet has changed."""
+        version = self.memory_store.fact_sheet_version
+        if self._index is not None and version == self._index_version:
+            return
+
+        # Grounding runs in a worker thread while facts are written on the event loop,
+        # so the index is built from a copy taken under the store's lock
+        version, entries = self.memory_store.search_snapshot()
+
+        index = {"topics": defaultdict(set), "entities": defaultdict(set), "content": defaultdict(set)}
+        facts = []
+        max_entity_len = 1
+
+        for topic, fields, fact_data in entries:
+            fact_id = len(facts)
+            metadata = fact_data.get("metadata", {})
+            facts.append({
+                "topic": topic,
+                "content": fact_data.get("content", ""),
+                "entities": metadata.get("entities", []),
+                "category": metadata.get("category", "unknown")
+            })
+
+            for token in _TOKEN_RE.findall(fields["topic_lc"]):
+                index["topics"][token].add(fact_id)
+            for token in _TOKEN_RE.findall(fields["content_lc"]):
+                index["content"][token].add(fact_id)
+            for entity_lc in fields["entities_lc"]:
+                entity_tokens = _TOKEN_RE.findall(entity_lc)
+                if entity_tokens:
+                    index["entities"][" ".join(entity_tokens)].add(fact_id)
+                    max_entity_len = max(max_entity_len, len(entity_tokens))
+
+        self._index = index
+        self._indexed_facts = facts
+        self._max_entity_len = max_entity_len
+        self._index_version = version
+        self._matrix_version = None
+
+    def _ensure_fact_matrix(self):
+        """Embed new or changed facts and restack the fact matrix."""
+        if self._fact_matrix is not None and self._matrix_version == self._index_version:
+            return
+
+        facts = self._indexed_facts
+        stale = [f for f in facts if self._embeddings.get(f["topic"], (None,))[0] != f["content"]]
+        if stale:
+            vectors = self.memory_store.embed_many([f["content"] for f in stale])
+            for fact, vector in zip(stale, vectors):
+                self._embeddings[fact["topic"]] = (fact["content"], *_quantize(_normalized(vector)))
+
+        live = {f["topic"] for f in facts}
+        for topic in list(self._embeddings):
+            if topic not in live:
+                del self._embeddings[topic]
+
+        if facts:
+            self._fact_matrix = np.stack([self._embeddings[f["topic"]][1] for f in facts])
+            self._fact_scales = np.array([self._embeddings[f["topic"]][2] for f in facts], dtype=np.float32)
+        else:
+            self._fact_matrix = np.zeros((0, 0), dtype=np.int8)
+            self._fact_scales = np.zeros(0, dtype=np.float32)
+        self._matrix_version = self._index_version
+
+    def _semantic_scores(self, query: str) -> Optional[np.ndarray]:
+        """Cosine similarity of the query against every fact, or None if embeddings are unavailable"""
+        if not self._indexed_facts:
+            return None
+        try:
+            # Loading the model is lazy; if it fails, grounding falls back to keyword scores
+            if self.memory_store.embedding_fn is None:
+                return None
+            self._ensure_fact_matrix()
+            # embed() is memoized, so search_memory reuses this query vector
+            query_q, query_scale = _quantize(_normalized(self.memory_store.embed(query)))
+            # int8 x int8 dot products accumulated in int32, then dequantized per row
+            dots = np.einsum("ij,j->i", self._fact_matrix, query_q, dtype=np.int32)
+            return dots * (self._fact_scales * query_scale)
+        except Exception as e:
+            logger.error("Error computing fact similarity: %s", e)
+            return None
+
     def retrieve_relevant_facts(self, query: str, max_facts: int = 5) -> List[Dict]:
         """
         Retrieve facts relevant to the query.
@@ -35,59 +156,49 @@ class GroundingAgent:
         Returns:
             List of relevant facts with their metadata
         """
-        relevant_facts = []
-        
-        # Get all facts from fact sheet
-        fact_sheet = self.memory_store.get_fact_sheet()
-        
-        # Simple relevance scoring based on keyword matching
-        # In production, you'd use semantic similarity
-        query_lower = query.lower()
-        
-        for topic, fact_data in fact_sheet.items():
-            if isinstance(fact_data, dict):
-                content = fact_data.get("content", "")
-                entities = fact_data.get("metadata", {}).get("entities", [])
-                category = fact_data.get("metadata", {}).get("category", "unknown")
-                
-                # Check if query mentions any entities or topic
-                relevance_score = 0
-                
-                # Topic match
-                if any(word in topic.lower() for word in query_lower.split()):
-                    relevance_score += 2
-                
-                # Entity match
-                for entity in entities:
-                    if entity.lower() in query_lower:
-                        relevance_score += 3
-                
-                # Content match
-                if any(word in content.lower() for word in query_lower.split() if len(word) > 3):
-                    relevance_score += 1
-                
-                if relevance_score > 0:
-                    relevant_facts.append({
-                        "topic": topic,
-                        "content": content,
-                        "entities": entities,
-                        "category": category,
-                        "relevance": relevance_score
-                    })
-            else:
-                # Handle old format (simple string)
-                if any(word in fact_data.lower() for word in query_lower.split() if len(word) > 3):
-                    relevant_facts.append({
-                        "topic": topic,
-                        "content": fact_data,
-                        "entities": [],
-                        "category": "unknown",
-                        "relevance": 1
-                    })
-        
-        # Sort by relevance and return top N
-        relevant_facts.sort(key=lambda x: x["relevance"], reverse=True)
-        return relevant_facts[:max_facts]
+        self._ensure_index()
+        index = self._index
+        tokens = _TOKEN_RE.findall(query.lower())
+        scores = defaultdict(int)
+
+        # Entity match: every entity phrase appearing in the query (3 points each)
+        phrases = {
+            " ".join(tokens[i:i + n])
+            for n in range(1, self._max_entity_len + 1)
+            for i in range(len(tokens) - n + 1)
+        }
+        for phrase in phrases:
+            for fact_id in index["entities"].get(phrase, ()):
+                scores[fact_id] += 3
+
+        # Topic match (2 points) and content match on longer words (1 point), once per fact
+        topic_hits = set()
+        content_hits = set()
+        for token in set(tokens):
+            topic_hits.update(index["topics"].get(token, ()))
+            if len(token) > 3:
+                content_hits.update(index["content"].get(token, ()))
+        for fact_id in topic_hits:
+            scores[fact_id] += 2
+        for fact_id in content_hits:
+            scores[fact_id] += 1
+
+        # Semantic similarity catches paraphrases; keyword hits act as an exact-match bonus
+        relevance = np.zeros(len(self._indexed_facts), dtype=np.float32)
+        for fact_id, score in scores.items():
+            relevance[fact_id] = score
+        relevant = relevance > 0
+        similarity = self._semantic_scores(query)
+        if similarity is not None:
+            relevant |= similarity >= self.similarity_threshold
+            relevance += np.where(relevant, np.clip(similarity, 0.0, None), 0.0)
+
+        # Highest relevance first; ties keep fact sheet order
+        candidates = np.flatnonzero(relevant)
+        if len(candidates) > max_facts:
+            candidates = candidates[np.argpartition(-relevance[candidates], max_facts)[:max_facts]]
+        ranked = sorted(candidates.tolist(), key=lambda i: (-relevance[i], i))
+        return [dict(self._indexed_facts[i], relevance=round(float(relevance[i]), 3)) for i in ranked]
     
     def retrieve_semantic_memories(self, query: str, limit: int = 3) -> List[Dict]:
         """
@@ -104,7 +215,7 @@ class GroundingAgent:
             memories = self.memory_store.search_memory(query, limit)
             return memories
         except Exception as e:
-            logger.error(f"Error retrieving semantic memories: {e}")
+            logger.error("Error retrieving semantic memories: %s", e)
             return []
     
     def enrich_query(self, query: str, max_facts: int = 5, include_memories: bool = True) -> str:
@@ -139,9 +250,10 @@ class GroundingAgent:
             memories = self.retrieve_semantic_memories(query, limit=2)
             if memories:
                 memory_strings = []
+                fact_contents = {f.get("content", "") for f in facts}
                 for mem in memories:
                     content = mem.get("content", "")
-                    if content and content not in [f.get("content", "") for f in facts]:
+                    if content and content not in fact_contents:
                         memory_strings.append(f"- {content}")
                 
                 if memory_strings:
@@ -150,7 +262,7 @@ class GroundingAgent:
         # Build enriched query
         if context_parts:
             enriched = "\n\n".join(context_parts) + f"\n\nUser query: {query}"
-            logger.info(f"Enriched query with {len(facts)} facts and context")
+            logger.info("Enriched query with %s facts and context", len(facts))
             return enriched
         else:
             logger.info("No relevant context found, using original query")
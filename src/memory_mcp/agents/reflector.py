@@ -1,20 +1,37 @@
-import json
+import asyncio
 import logging
-from typing import List, Dict, Optional
+import numpy as np
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
 import google.generativeai as genai
-import requests
 
 try:
     from src.memory_mcp.config import config
+    from src.memory_mcp.gemini_pool import get_model
     from src.memory_mcp.memory_store import MemoryStore
+    from src.memory_mcp.http_pool import OLLAMA_KEEP_ALIVE, get_async_client
+    from src.memory_mcp import json_utils
 except ImportError:
     from config import config
+    from gemini_pool import get_model
     from memory_store import MemoryStore
+    from http_pool import OLLAMA_KEEP_ALIVE, get_async_client
+    import json_utils
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Upper bound on memories handed to the LLM in one consolidation pass
+CONSOLIDATION_BATCH_LIMIT = 200
+
+
+def _parse_datetime(value) -> np.datetime64:
+    """ISO timestamp as datetime64[us], NaT if it is not one"""
+    try:
+        return np.datetime64(value, "us")
+    except (ValueError, TypeError):
+        return np.datetime64("NaT", "us")
+
+
 class ReflectorAgent:
     """
     Agent responsible for memory consolidation and maintenance.
@@ -25,12 +42,13 @@ class ReflectorAgent:
         self.provider = provider or config.get("monitor.provider", "google")
         self.model_name = model or config.get("monitor.model", "gemini-flash-latest")
         self.ollama_url = config.get("ollama.url", "http://localhost:11434")
+        self.chunk_size = config.get("reflector.chunk_size", 50)
+        self.max_concurrency = config.get("reflector.max_concurrency", 8)
         
         if self.provider == "google":
             api_key = config.google_api_key
             if api_key:
-                genai.configure(api_key=api_key)
-                self.google_model = genai.GenerativeModel(self.model_name)
+                self.google_model = get_model(self.model_name, api_key)
         
     def _build_consolidation_prompt(self, memories: List[Dict]) -> str:
         memory_text = "\n".join([f"- [{m.get('id')}] (Importance: {m.get('metadata', {}).get('importance_score', 0.5)}) {m.get('content')}" for m in memories])
@@ -58,100 +76,153 @@ Return ONLY a JSON list of facts to add to the Fact Sheet:
 ]"""
         return prompt
 
-    async def reflect(self, store: MemoryStore):
-        """Perform a reflection cycle: consolidate and prune"""
+    async def reflect(self, store: MemoryStore, monitor=None):
+        """
+        Perform a reflection cycle: consolidate and prune.
+        If a MonitorAgent is passed, its local classifier is retrained on the latest LLM labels.
+        """
         logger.info("Starting memory reflection cycle...")
         
-        # 1. Fetch recent or high-importance episodic memories
-        # For simplicity in this version, we fetch a sample or items without 'consolidated' flag
-        # (ChromaDB doesn't support complex filters well on all versions, so we fetch and filter locally)
-        all_memories = store.collection.get()
-        ids = all_memories['ids']
-        metadatas = all_memories['metadatas']
-        documents = all_memories['documents']
-        
-        candidates = []
-        for i in range(len(ids)):
-            meta = metadatas[i]
-            # Only consolidate items that are high importance or haven't been processed
-            if not meta.get("consolidated") and meta.get("importance_score", 0) > 0.4:
-                candidates.append({
-                    "id": ids[i],
-                    "content": documents[i],
-                    "metadata": meta
-                })
+        # Commit queued episodic writes so this cycle sees them
+        await asyncio.to_thread(store.flush_memories)
+
+        # 1. Fetch higher-importance episodic memories no earlier cycle has reviewed.
+        # The filter runs inside Chroma, so only candidates are loaded, never the whole collection.
+        fetched = await asyncio.to_thread(
+            store.collection.get,
+            where={"$and": [
+                {"consolidated": {"$ne": True}},
+                {"reflected": {"$ne": True}},
+                {"importance_score": {"$gt": 0.4}}
+            ]},
+            limit=CONSOLIDATION_BATCH_LIMIT,
+            include=["metadatas", "documents"]
+        )
+        candidates = [
+            {"id": memory_id, "content": document, "metadata": meta}
+            for memory_id, document, meta in zip(fetched['ids'], fetched['documents'], fetched['metadatas'])
+        ]
         
         if len(candidates) >= 3:
-            logger.info(f"Consolidating {len(candidates)} memory candidates...")
-            facts = await self._consolidate(candidates)
+            logger.info("Consolidating %s memory candidates...", len(candidates))
+            facts, reviewed_ids = await self._consolidate_chunks(candidates)
             
-            for fact in facts:
-                store.update_fact_with_metadata(
-                    topic=fact['topic'],
-                    content=fact['content'],
-                    importance=fact['importance'],
-                    category=fact['category']
-                )
-                # Mark source memories as consolidated
-                for src_id in fact.get('source_ids', []):
-                    # We can either delete or tag them
-                    # Tagging is safer for traceability
-                    meta = store.collection.get(ids=[src_id])['metadatas'][0]
-                    meta["consolidated"] = True
-                    store.collection.update(ids=[src_id], metadatas=[meta])
+            # Mark source memories as consolidated (tagging is safer than deleting for traceability),
+            # and the other memories the LLM reviewed as reflected, so the next cycle fetches new
+            # candidates instead of the same batch. Only consolidated memories become prunable.
+            # Their metadata was fetched with the candidates, so one batched update covers every tag.
+            meta_by_id = {c["id"]: c["metadata"] for c in candidates}
+            src_ids = {
+                src_id for fact in facts for src_id in fact.get('source_ids', []) if src_id in meta_by_id
+            }
+            tagged_ids = list(dict.fromkeys([*reviewed_ids, *src_ids]))
+            for memory_id in tagged_ids:
+                meta_by_id[memory_id]["consolidated" if memory_id in src_ids else "reflected"] = True
+
+            # Facts are independent, so they are written concurrently with the Chroma tag update
+            writes = [self._apply_fact(store, fact) for fact in facts]
+            if tagged_ids:
+                writes.append(asyncio.to_thread(
+                    store.collection.update, ids=tagged_ids, metadatas=[meta_by_id[i] for i in tagged_ids]
+                ))
+            await asyncio.gather(*writes)
                     
         # 2. Pruning: Remove low importance memories older than 30 days
-        self._prune(store, ids, metadatas)
+        await asyncio.to_thread(self._prune, store)
+
+        # 3. Distil recent LLM classifications into the monitor's local classifier
+        if monitor is not None:
+            try:
+                await asyncio.to_thread(monitor.train_local_classifier)
+            except Exception as e:
+                logger.error("Local classifier training failed: %s", e)
         
         logger.info("Reflection cycle complete.")
 
-    async def _consolidate(self, memories: List[Dict]) -> List[Dict]:
-        """Call LLM to consolidate memories"""
+    async def _apply_fact(self, store: MemoryStore, fact: Dict):
+        """Write one consolidated fact to the fact sheet off the event loop"""
+        await asyncio.to_thread(
+            store.update_fact_with_metadata,
+            topic=fact['topic'],
+            content=fact['content'],
+            importance=fact['importance'],
+            category=fact['category']
+        )
+
+    async def _consolidate_chunks(self, memories: List[Dict]) -> Tuple[List[Dict], List[str]]:
+        """
+        Consolidate `chunk_size` memories per LLM call, with up to `max_concurrency` calls in flight.
+        Returns the facts and the ids of the memories whose chunk the LLM actually reviewed.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(chunk: List[Dict]) -> Optional[List[Dict]]:
+            async with semaphore:
+                return await self._consolidate(chunk)
+
+        chunks = [memories[i:i + self.chunk_size] for i in range(0, len(memories), self.chunk_size)]
+        results = await asyncio.gather(*(run(chunk) for chunk in chunks))
+        facts = [fact for result in results if result for fact in result]
+        reviewed_ids = [m["id"] for chunk, result in zip(chunks, results) if result is not None for m in chunk]
+        return facts, reviewed_ids
+
+    async def _consolidate(self, memories: List[Dict]) -> Optional[List[Dict]]:
+        """Call LLM to consolidate memories; None if the call failed"""
         prompt = self._build_consolidation_prompt(memories)
         
         try:
             if self.provider == "google":
-                response = self.google_model.generate_content(
+                # The Gemini SDK call blocks; keep it off the event loop
+                response = await asyncio.to_thread(
+                    self.google_model.generate_content,
                     prompt,
                     generation_config=genai.types.GenerationConfig(
                         temperature=0.1,
                         response_mime_type="application/json"
                     )
                 )
-                return json.loads(response.text)
+                return json_utils.loads(response.text)
             else:
                 # Ollama fallback
                 payload = {
                     "model": self.model_name,
                     "prompt": prompt,
                     "stream": False,
+                    "keep_alive": OLLAMA_KEEP_ALIVE,
                     "format": "json"
                 }
-                res = requests.post(f"{self.ollama_url}/api/generate", json=payload, timeout=60)
+                res = await get_async_client().post(f"{self.ollama_url}/api/generate", content=json_utils.dumps(payload),
+                                                    headers=json_utils.JSON_HEADERS, timeout=60)
                 if res.status_code == 200:
-                    return json.loads(res.json().get('response', '[]'))
+                    return json_utils.loads(json_utils.loads(res.content).get('response', '[]'))
         except Exception as e:
-            logger.error(f"Consolidation error: {e}")
+            logger.error("Consolidation error: %s", e)
             
-        return []
+        return None
 
-    def _prune(self, store: MemoryStore, ids: List[str], metadatas: List[Dict]):
+    def _prune(self, store: MemoryStore):
         """Remove outdated, low-importance memories"""
-        now = datetime.now()
-        thirty_days_ago = (now - timedelta(days=30)).isoformat()
-        
-        to_delete = []
-        for i in range(len(ids)):
-            meta = metadatas[i]
-            importance = meta.get("importance_score", 0.5)
-            created_at = meta.get("created_at", "")
-            
-            # Delete if low importance and old OR if already consolidated and very old
-            if importance < 0.3 and created_at < thirty_days_ago:
-                to_delete.append(ids[i])
-            elif meta.get("consolidated") and created_at < thirty_days_ago:
-                to_delete.append(ids[i])
+        cutoff = np.datetime64(datetime.now() - timedelta(days=30), "us")
+
+        # Only prune candidates (low importance or already consolidated) are fetched, metadata only
+        fetched = store.collection.get(
+            where={"$or": [{"importance_score": {"$lt": 0.3}}, {"consolidated": True}]},
+            include=["metadatas"]
+        )
+        ids = fetched['ids']
+        if not ids:
+            return
+
+        # created_at is parsed column-wise in one C pass; a missing timestamp counts as old
+        raw = [meta.get("created_at") or "" for meta in fetched['metadatas']]
+        try:
+            created_at = np.array(raw, dtype="datetime64[us]")
+        except (ValueError, TypeError):
+            # A malformed value fails the whole column; parse row by row, treating it as missing
+            created_at = np.array([_parse_datetime(value) for value in raw], dtype="datetime64[us]")
+        old = np.isnat(created_at) | (created_at < cutoff)
+        to_delete = [ids[i] for i in np.flatnonzero(old)]
                 
         if to_delete:
-            logger.info(f"Pruning {len(to_delete)} old/low-value memories.")
+            logger.info("Pruning %s old/low-value memories.", len(to_delete))
             store.collection.delete(ids=to_delete)
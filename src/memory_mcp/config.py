@@ -1,28 +1,57 @@
 import os
+import functools
 import yaml
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from dotenv import load_dotenv, find_dotenv
 
+# libyaml's C loader when available; the pure-Python loader is several times slower
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+@functools.lru_cache(maxsize=8)
+def _parse(path: str, mtime: float) -> Dict[str, Any]:
+    """Parse a YAML file once per modification time"""
+    with open(path, 'r') as f:
+        return yaml.load(f, Loader=_YAML_LOADER)
+
+
 class Config:
     def __init__(self, config_path: str = "config.yaml"):
         # Load .env file if it exists
         load_dotenv(find_dotenv())
         
         self.config_path = config_path
-        self.data = self._load_config()
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        # Read on access, so env-only lookups (google_api_key) never touch the file; each access
+        # costs one stat, and the file is re-parsed only after config.yaml changes
+        return self._load_config()
+
+    @functools.cached_property
+    def _path(self) -> Optional[str]:
+        path = self._resolve_path()
+        return os.path.abspath(path) if path is not None else None
+
+    def _resolve_path(self) -> Optional[str]:
+        if os.path.exists(self.config_path):
+            return self.config_path
+        # Try absolute path relative to project root
+        base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        abs_path = os.path.join(base_dir, self.config_path)
+        if os.path.exists(abs_path):
+            return abs_path
+        return None
 
     def _load_config(self) -> Dict[str, Any]:
-        if not os.path.exists(self.config_path):
-            # Try absolute path relative to project root
-            base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-            abs_path = os.path.join(base_dir, self.config_path)
-            if os.path.exists(abs_path):
-                with open(abs_path, 'r') as f:
-                    return yaml.safe_load(f)
+        path = self._path
+        if path is None:
             return {}
-        
-        with open(self.config_path, 'r') as f:
-            return yaml.safe_load(f)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return {}
+        return _parse(path, mtime) or {}
 
     def get(self, key: str, default: Any = None) -> Any:
         # Support nested keys like "monitor.model"
@@ -40,5 +69,11 @@ class Config:
         # Check env var first, then config
         return os.environ.get("GOOGLE_API_KEY") or self.get("google.api_key")
 
+    @property
+    def data_dir(self) -> str:
+        """Directory for databases and caches: $MEMORY_MCP_HOME, then storage.data_dir, then ~/.memory_mcp"""
+        path = os.environ.get("MEMORY_MCP_HOME") or self.get("storage.data_dir")
+        return os.path.expanduser(path) if path else os.path.join(os.path.expanduser("~"), ".memory_mcp")
+
 # Global config instance
 config = Config()
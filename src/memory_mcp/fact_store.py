@@ -0,0 +1,85 @@
+"""
+SQLite persistence for the semantic fact sheet.
+Each fact is one row, so an update writes a single row instead of
+re-serializing the whole sheet; WAL mode lets other processes read meanwhile.
+"""
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+try:
+    from src.memory_mcp import json_utils
+except ImportError:
+    import json_utils
+
+
+class FactStore:
+    """
+    Thin wrapper over a SQLite file with one table:
+    facts(topic, content, category, updated_at, metadata, content_hashes).
+    Entity lookups are served by MemoryStore's in-memory index, rebuilt on load.
+    Metadata is kept as a JSON column so the fact structure round-trips unchanged;
+    content_hashes (digests of content a topic absorbed) is bookkeeping kept out of it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS facts (
+                topic TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                category TEXT,
+                updated_at TEXT,
+                metadata TEXT NOT NULL,
+                content_hashes TEXT
+            );
+            -- Written by earlier versions but never read
+            DROP TABLE IF EXISTS entities;
+        """)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(facts)")}
+        if "content_hashes" not in columns:
+            self.conn.execute("ALTER TABLE facts ADD COLUMN content_hashes TEXT")
+        self.conn.commit()
+
+    @property
+    def schema_version(self) -> int:
+        """Fact format version stamped in the database header (PRAGMA user_version)"""
+        with self._lock:
+            return self.conn.execute("PRAGMA user_version").fetchone()[0]
+
+    @schema_version.setter
+    def schema_version(self, version: int):
+        with self._lock, self.conn:
+            self.conn.execute(f"PRAGMA user_version = {int(version)}")
+
+    def load_all(self) -> Dict[str, Dict]:
+        """Every fact as {topic: {"content": ..., "metadata": {...}}}"""
+        with self._lock:
+            rows = self.conn.execute("SELECT topic, content, metadata FROM facts").fetchall()
+        return {topic: {"content": content, "metadata": json_utils.loads(metadata)} for topic, content, metadata in rows}
+
+    def load_content_hashes(self) -> Dict[str, List[str]]:
+        """Absorbed-content digests per topic, oldest first"""
+        with self._lock:
+            rows = self.conn.execute("SELECT topic, content_hashes FROM facts WHERE content_hashes IS NOT NULL").fetchall()
+        return {topic: json_utils.loads(hashes) for topic, hashes in rows}
+
+    def upsert_many(self, facts: Iterable[Tuple[str, Dict, List[str]]]):
+        """Insert or replace (topic, fact, content hashes) rows in one transaction"""
+        with self._lock, self.conn:
+            for topic, data, content_hashes in facts:
+                metadata = data.get("metadata") or {}
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO facts (topic, content, category, updated_at, metadata, content_hashes) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (topic, data.get("content", ""), metadata.get("category"), metadata.get("updated_at"),
+                     json_utils.dumps(metadata).decode("utf-8"), json_utils.dumps(content_hashes).decode("utf-8"))
+                )
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,53 @@
+"""
+Process-wide cache of Gemini models.
+Agents that use the same model share one GenerativeModel instead of each
+configuring the SDK and building their own.
+"""
+import functools
+import logging
+import threading
+from typing import Optional
+
+import google.generativeai as genai
+
+logger = logging.getLogger(__name__)
+
+_configured_key: Optional[str] = None
+_lock = threading.Lock()
+
+
+def configure(api_key: str):
+    """Configure the Gemini SDK once per API key."""
+    global _configured_key
+    with _lock:
+        if _configured_key != api_key:
+            genai.configure(api_key=api_key)
+            _configured_key = api_key
+
+
+@functools.lru_cache(maxsize=8)
+def get_model(model_name: str, api_key: str, system_instruction: Optional[str] = None) -> genai.GenerativeModel:
+    """Return the shared GenerativeModel for this model name and system instruction."""
+    configure(api_key)
+    if system_instruction is None:
+        return genai.GenerativeModel(model_name)
+    return genai.GenerativeModel(model_name, system_instruction=system_instruction)
+
+
+def response_text(response) -> Optional[str]:
+    """
+    Text of a generate_content response, or None when there is none to parse.
+    `response.text` raises when the candidate has no parts (e.g. the output budget went
+    on thinking tokens), and a reply cut off at MAX_TOKENS is truncated JSON.
+    """
+    if not response.candidates:
+        logger.warning("Gemini returned no candidates")
+        return None
+    candidate = response.candidates[0]
+    if candidate.finish_reason == genai.protos.Candidate.FinishReason.MAX_TOKENS:
+        logger.warning("Gemini reply hit max_output_tokens; discarding the truncated output")
+        return None
+    if not candidate.content.parts:
+        logger.warning("Gemini returned no content (finish reason %s)", candidate.finish_reason)
+        return None
+    return response.text
@@ -0,0 +1,102 @@
+"""
+Shared HTTP connection pool for the agents talking to Ollama.
+Reusing one keep-alive session avoids a TCP handshake on every LLM call.
+"""
+import asyncio
+import atexit
+import logging
+import threading
+import weakref
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# How long Ollama keeps a model resident after a request. Every /api/generate call must
+# pass it: a request without keep_alive resets the model's timer to Ollama's 5 minute default.
+OLLAMA_KEEP_ALIVE = "30m"
+
+_session = None
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def build_session(pool_connections: int = 16, pool_maxsize: int = 32) -> requests.Session:
+    """Create a keep-alive session with a pooled adapter mounted for http and https."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Connection": "keep-alive", "Accept-Encoding": "gzip, deflate"})
+    return session
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide session shared by all agents."""
+    global _session
+    if _session is None:
+        _session = build_session()
+    return _session
+
+
+def build_async_client() -> httpx.AsyncClient:
+    """Create an async keep-alive client so concurrent LLM calls overlap instead of queueing."""
+    return httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(60.0, connect=10.0),
+        limits=httpx.Limits(max_keepalive_connections=40, max_connections=100, keepalive_expiry=30.0),
+    )
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Return the async client shared by all agents on the running event loop.
+    Pooled connections are bound to the loop that opened them, so each loop gets its own client.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = build_async_client()
+        _async_clients[loop] = client
+    return client
+
+
+def close_all():
+    """Close the shared session and any async clients whose event loop can still run them."""
+    global _session
+    if _session is not None:
+        _session.close()
+        _session = None
+    for loop, client in list(_async_clients.items()):
+        if client.is_closed or loop.is_closed() or loop.is_running():
+            continue
+        try:
+            loop.run_until_complete(client.aclose())
+        except Exception as e:
+            logger.debug("Failed to close async HTTP client: %s", e)
+    _async_clients.clear()
+
+
+atexit.register(close_all)
+
+
+def warm_up_ollama_model(session: requests.Session, ollama_url: str, model: str,
+                         keep_alive: str = OLLAMA_KEEP_ALIVE) -> threading.Thread:
+    """
+    Load an Ollama model in the background and pin it in memory for `keep_alive`,
+    so the first real request does not pay the multi-second cold-load cost.
+    """
+    def _warm():
+        try:
+            session.post(
+                f"{ollama_url}/api/generate",
+                json={"model": model, "prompt": "", "keep_alive": keep_alive, "options": {"num_predict": 1}},
+                timeout=120,
+            )
+            logger.debug("Warmed up Ollama model %s", model)
+        except Exception as e:
+            logger.warning("Ollama warm-up for %s failed: %s", model, e)
+
+    thread = threading.Thread(target=_warm, name=f"ollama-warmup-{model}", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,74 @@
+"""
+JSON helpers backed by orjson when available, falling back to the stdlib.
+orjson parses LLM responses several times faster with less garbage.
+"""
+import json
+import mmap
+import os
+import re
+from typing import Any, Dict, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is a declared dependency
+    orjson = None
+
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# A flat JSON object (values may hold lists and strings, but no nested objects)
+_OBJECT_RE = re.compile(r"\{[^{}]*\}")
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Parse JSON from bytes or str"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def load_file(path: str) -> Any:
+    """
+    Parse a JSON file. With orjson the file is memory-mapped and parsed in place,
+    without first copying it into a bytes object.
+    """
+    with open(path, "rb") as f:
+        if orjson is None or os.fstat(f.fileno()).st_size == 0:
+            return loads(f.read())
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view:
+                return orjson.loads(view)
+
+
+def dumps(obj: Any, indent: bool = False) -> bytes:
+    """Serialize to UTF-8 JSON bytes (compact unless `indent`), ready to send as a request body"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else None)
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def extract_object(text: str) -> Optional[Dict]:
+    """
+    First JSON object in an LLM response, or None if there is none.
+    Handles a closing brace eaten by a "}\n" stop sequence and prose or
+    several objects around the JSON.
+    """
+    text = text.strip()
+    if text.startswith("{") and not text.endswith("}"):
+        text += "}"
+    try:
+        parsed = loads(text)
+        if isinstance(parsed, dict):
+            return parsed
+    except ValueError:
+        pass
+    for match in _OBJECT_RE.finditer(text):
+        try:
+            parsed = loads(match.group())
+        except ValueError:
+            continue
+        if isinstance(parsed, dict):
+            return parsed
+    return None
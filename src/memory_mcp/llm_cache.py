@@ -0,0 +1,164 @@
+"""
+Persistent content-hash cache for LLM agent responses.
+Identical inputs (retries, repeated messages, re-ingested logs) are answered
+from disk instead of another round-trip to Gemini/Ollama.
+"""
+import asyncio
+import atexit
+import functools
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+try:
+    from src.memory_mcp.config import config
+    from src.memory_mcp import json_utils
+except ImportError:
+    from config import config
+    import json_utils
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=4096)
+def content_key(*parts: str) -> str:
+    """SHA-256 of the joined parts; memoized so hot repeats skip hashing entirely."""
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    JSON-file cache mapping a content hash to a previous LLM result.
+    Writes are batched: the file is rewritten every `save_every` puts and at exit.
+    With `max_entries` set, the least recently used entries are evicted beyond that size.
+    """
+
+    def __init__(self, filename: str, base_dir: Optional[str] = None, save_every: int = 20,
+                 max_entries: Optional[int] = None):
+        if base_dir is None:
+            base_dir = config.data_dir
+        os.makedirs(base_dir, exist_ok=True)
+        self.path = os.path.join(base_dir, filename)
+        self.save_every = save_every
+        self.max_entries = max_entries
+        # Ordered oldest to most recently used; JSON keeps the order across restarts
+        self.entries: OrderedDict = OrderedDict(self._load())
+        self._evict()
+        self.hits = 0
+        self.misses = 0
+        self._unsaved = 0
+        atexit.register(self.save)
+
+    def _load(self) -> Dict:
+        if os.path.exists(self.path):
+            try:
+                return json_utils.load_file(self.path)
+            except Exception:
+                return {}
+        return {}
+
+    def get(self, key: str) -> Optional[Dict]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return dict(entry["value"])
+
+    def put(self, key: str, value: Dict):
+        self.entries[key] = {"value": value, "cached_at": datetime.now().isoformat()}
+        self.entries.move_to_end(key)
+        self._evict()
+        self._unsaved += 1
+        if self._unsaved >= self.save_every:
+            self.save()
+
+    def _evict(self):
+        if self.max_entries is None:
+            return
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def save(self):
+        if not self._unsaved:
+            return
+        try:
+            with open(self.path, "wb") as f:
+                f.write(json_utils.dumps(self.entries))
+            self._unsaved = 0
+        except Exception as e:
+            logger.error("Failed to save LLM cache %s: %s", self.path, e)
+
+    def close(self):
+        """Save now and drop the exit hook, so a replaced cache can't overwrite its successor's file"""
+        self.save()
+        atexit.unregister(self.save)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+
+class InflightCalls:
+    """
+    Collapses concurrent calls that share a key into a single LLM request.
+    Late arrivals wait for the first caller's result instead of issuing their own.
+    """
+
+    def __init__(self):
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._slots: Dict[str, Dict] = {}
+
+    async def run(self, key: str, call: Callable[[], Awaitable[Dict]]) -> Dict:
+        pending = self._futures.get(key)
+        if pending is not None:
+            return dict(await asyncio.shield(pending))
+
+        future = asyncio.get_running_loop().create_future()
+        self._futures[key] = future
+        try:
+            result = await call()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            self._futures.pop(key, None)
+
+    def run_sync(self, key: str, call: Callable[[], Dict]) -> Dict:
+        with self._lock:
+            slot = self._slots.get(key)
+            owner = slot is None
+            if owner:
+                slot = {"event": threading.Event(), "result": None}
+                self._slots[key] = slot
+
+        if not owner:
+            slot["event"].wait()
+            if slot["result"] is not None:
+                return dict(slot["result"])
+            return call()  # first caller failed; retry on our own
+
+        try:
+            slot["result"] = call()
+            return slot["result"]
+        finally:
+            with self._lock:
+                self._slots.pop(key, None)
+            slot["event"].set()
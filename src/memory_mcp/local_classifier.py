@@ -0,0 +1,122 @@
+"""
+Local message classifier distilled from previous LLM classifications.
+A softmax regression over sentence embeddings answers confident cases in
+microseconds; only uncertain messages still go to Gemini/Ollama.
+"""
+import logging
+import os
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+try:
+    from src.memory_mcp.config import config
+except ImportError:
+    from config import config
+
+logger = logging.getLogger(__name__)
+
+
+class _Model(NamedTuple):
+    weights: np.ndarray
+    bias: np.ndarray
+    categories: List[str]
+    important: np.ndarray
+    importance_scores: np.ndarray
+
+
+class LocalClassifier:
+    """
+    Multinomial logistic regression from a normalized message embedding to a category.
+    Each category also carries the majority `important` flag and mean importance_score
+    seen in its training labels, so a prediction yields a full classification dict.
+    """
+
+    def __init__(self, filename: str = "monitor_classifier.npz", base_dir: Optional[str] = None,
+                 confidence_threshold: float = 0.9, min_samples: int = 50):
+        if base_dir is None:
+            base_dir = config.data_dir
+        os.makedirs(base_dir, exist_ok=True)
+        self.path = os.path.join(base_dir, filename)
+        self.confidence_threshold = confidence_threshold
+        self.min_samples = min_samples
+        # Replaced as a whole by fit(), so a concurrent predict() never mixes two models
+        self.model: Optional[_Model] = None
+        self._load()
+
+    @property
+    def trained(self) -> bool:
+        return self.model is not None
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                self.model = _Model(data["weights"], data["bias"], [str(c) for c in data["categories"]],
+                                    data["important"], data["importance_scores"])
+        except Exception as e:
+            logger.error("Failed to load local classifier %s: %s", self.path, e)
+            self.model = None
+
+    def _save(self, model: _Model):
+        try:
+            np.savez(self.path, weights=model.weights, bias=model.bias, categories=np.array(model.categories),
+                     important=model.important, importance_scores=model.importance_scores)
+        except Exception as e:
+            logger.error("Failed to save local classifier %s: %s", self.path, e)
+
+    def fit(self, vectors: np.ndarray, labels: List[Dict], epochs: int = 300,
+            learning_rate: float = 0.5, l2: float = 1e-3) -> bool:
+        """Train on (embedding, LLM classification) pairs; returns False if there is too little data"""
+        categories = sorted({str(label.get("category", "unknown")) for label in labels})
+        if len(labels) < self.min_samples or len(categories) < 2:
+            logger.info("Not enough labelled messages to train local classifier (%s)", len(labels))
+            return False
+
+        index = {c: i for i, c in enumerate(categories)}
+        y = np.array([index[str(label.get("category", "unknown"))] for label in labels])
+        x = np.asarray(vectors, dtype=np.float32)
+        onehot = np.eye(len(categories), dtype=np.float32)[y]
+        weights = np.zeros((x.shape[1], len(categories)), dtype=np.float32)
+        bias = np.zeros(len(categories), dtype=np.float32)
+
+        # Full-batch gradient descent; a few thousand rows converge in well under a second
+        for _ in range(epochs):
+            probs = self._softmax(x @ weights + bias)
+            error = (probs - onehot) / len(x)
+            weights -= learning_rate * (x.T @ error + l2 * weights)
+            bias -= learning_rate * error.sum(axis=0)
+
+        important = np.array([label.get("important", False) for label in labels], dtype=np.float32)
+        scores = np.array([label.get("importance_score", 0.5) for label in labels], dtype=np.float32)
+        counts = np.bincount(y, minlength=len(categories))
+        model = _Model(weights, bias, categories,
+                       np.bincount(y, weights=important, minlength=len(categories)) / counts >= 0.5,
+                       np.bincount(y, weights=scores, minlength=len(categories)) / counts)
+        self.model = model
+        self._save(model)
+        logger.info("Trained local classifier on %s messages across %s categories", len(labels), len(categories))
+        return True
+
+    def predict(self, vector: np.ndarray) -> Optional[Dict]:
+        """Classification dict if the model is confident, otherwise None"""
+        model = self.model
+        if model is None:
+            return None
+        probs = self._softmax(np.asarray(vector, dtype=np.float32) @ model.weights + model.bias)
+        best = int(np.argmax(probs))
+        confidence = float(probs[best])
+        if confidence < self.confidence_threshold:
+            return None
+        return {
+            "important": bool(model.important[best]),
+            "category": model.categories[best],
+            "confidence": round(confidence, 3),
+            "importance_score": round(float(model.importance_scores[best]), 2)
+        }
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        shifted = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        return shifted / shifted.sum(axis=-1, keepdims=True)
@@ -1,52 +1,290 @@
-import chromadb
-from chromadb.utils import embedding_functions
-import uuid
+import base64
+import hashlib
+import logging
+import numpy as np
 from typing import List, Dict, Optional, Any
 from datetime import datetime
 import os
-import json
+import atexit
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+try:
+    from src.memory_mcp.config import config
+    from src.memory_mcp.fact_store import FactStore
+    from src.memory_mcp import json_utils
+except ImportError:
+    from config import config
+    from fact_store import FactStore
+    import json_utils
+
+logger = logging.getLogger(__name__)
+
+# How many integrated-content digests to remember per topic
+MAX_CONTENT_HASHES = 64
+# Fact writes within this window are committed in one transaction
+SAVE_DEBOUNCE_SECONDS = 0.5
+# Bumped when _migrate_fact_sheet learns a new upgrade; stored facts at this version skip it
+FACT_SCHEMA_VERSION = 3
+# Recently embedded texts kept (and persisted) so a text is run through the model once
+EMBEDDING_CACHE_SIZE = 10000
+
+
+_CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+# RFC 4648 base32 -> Crockford base32, so 10-byte blocks encode to 16 chars in C
+_TO_CROCKFORD = bytes.maketrans(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ234567", _CROCKFORD.encode("ascii"))
+_ulid_lock = threading.Lock()
+_ulid_state = {"ms": -1, "prefix": "", "random": 0}
+
+
+def new_memory_id() -> str:
+    """
+    Monotonic ULID: 48-bit millisecond timestamp + 80-bit random part, as 26 Crockford
+    base32 chars. Within one millisecond the random part is incremented instead of redrawn,
+    so ids sort in creation order and only one entropy read is made per millisecond.
+    """
+    with _ulid_lock:
+        state = _ulid_state
+        now = time.time_ns() // 1_000_000
+        if now <= state["ms"]:
+            state["random"] = (state["random"] + 1) & ((1 << 80) - 1)
+        else:
+            state["ms"] = now
+            state["prefix"] = "".join(_CROCKFORD[(now >> shift) & 31] for shift in range(45, -1, -5))
+            state["random"] = int.from_bytes(os.urandom(10), "big")
+        prefix, random = state["prefix"], state["random"]
+    return prefix + base64.b32encode(random.to_bytes(10, "big")).translate(_TO_CROCKFORD).decode("ascii")
+
+
+def content_digest(content: str) -> str:
+    """Short BLAKE2b digest used to recognise content a topic has already absorbed"""
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def mmr_select(query: np.ndarray, candidates: np.ndarray, k: int, lam: float) -> List[int]:
+    """
+    Maximal marginal relevance: indices of `k` candidates balancing similarity to the
+    query (weight `lam`) against similarity to the candidates already picked.
+    Pairwise similarities are computed once; each pick is a vectorized argmax.
+    """
+    norms = np.linalg.norm(candidates, axis=1, keepdims=True)
+    unit = candidates / np.where(norms == 0, 1, norms)
+    query_sim = unit @ (query / (np.linalg.norm(query) or 1))
+    pairwise = unit @ unit.T
+
+    redundancy = np.zeros(len(candidates), dtype=np.float32)
+    available = np.ones(len(candidates), dtype=bool)
+    selected = []
+    for _ in range(min(k, len(candidates))):
+        scores = np.where(available, lam * query_sim - (1 - lam) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, pairwise[:, best])
+    return selected
+
 
 class MemoryStore:
-    def __init__(self, path: Optional[str] = None):
-        if path is None:
-            # Default to user's home directory for persistence
-            base_dir = os.path.join(os.path.expanduser("~"), ".memory_mcp")
+    def __init__(self, path: Optional[str] = None, embedding_function=None, in_memory: bool = False):
+        """
+        `embedding_function` (texts -> vectors) overrides the configured backend, e.g. to
+        share one already-loaded model between several stores.
+        With `in_memory` nothing touches disk: Chroma runs ephemeral, facts live in an
+        in-memory SQLite database and the embedding cache is not persisted.
+        """
+        if in_memory:
+            base_dir = path = None
+        elif path is None:
+            # Default to the configured data directory (~/.memory_mcp unless overridden)
+            base_dir = config.data_dir
             path = os.path.join(base_dir, "chroma_db")
         else:
             base_dir = os.path.dirname(path)
 
-        os.makedirs(base_dir, exist_ok=True)
+        if base_dir is not None:
+            os.makedirs(base_dir, exist_ok=True)
             
-        self.client = chromadb.PersistentClient(path=path)
-        # Use default sentence-transformers model
-        self.embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="all-MiniLM-L6-v2"
-        )
-        self.collection = self.client.get_or_create_collection(
-            name="memory",
-            embedding_function=self.embedding_fn
-        )
+        # Chroma and the embedding model are heavy to import and load, so both are opened
+        # on first use; the fact sheet alone serves tool listing and fact reads
+        self.chroma_path = path
+        # Ephemeral Chroma clients share one in-process database, so each in-memory store
+        # gets a collection of its own
+        self.collection_name = "memory" if path is not None else f"memory-{os.urandom(8).hex()}"
+        self._client = None
+        self._collection = None
+        self._embedding_fn = embedding_function
+        self._chroma_lock = threading.RLock()
+        # all-MiniLM-L6-v2, by default through ONNX Runtime with int8 weights
+        self.embedding_backend = config.get("embedding.backend", "onnx-int8")
+        self.embedding_model = config.get("embedding.model", "all-MiniLM-L6-v2")
+        if embedding_function is not None:
+            self.embedding_backend = "custom"
+            self.embedding_model = type(embedding_function).__name__
+        self.embedding_model_id = f"{self.embedding_backend}:{self.embedding_model}"
+        # content digest -> read-only vector, least recently used first
+        self.embedding_cache_size = config.get("embedding.cache_size", EMBEDDING_CACHE_SIZE)
+        self.embedding_cache_path = os.path.join(base_dir, "embeddings.npz") if base_dir is not None else None
+        self._embeddings: OrderedDict = self._load_embeddings()
+        self._embeddings_dirty = False
+        self._embed_lock = threading.Lock()
+        atexit.register(self.save_embeddings)
+        # Episodic writes are buffered and committed to Chroma as one batch
+        self.write_window = config.get("embedding.batch_window_ms", 250) / 1000
+        self.max_batch = config.get("embedding.max_batch", 128)
+        # 1.0 returns plain nearest neighbours; lower values trade relevance for diversity
+        self.mmr_lambda = config.get("grounding.mmr_lambda", 0.7)
+        self._pending: List[tuple] = []
+        # Memory id -> last_accessed from searches, written with the next batch
+        self._accessed: Dict[str, str] = {}
+        self._pending_lock = threading.Lock()
+        # Held while a batch is embedded and written, so readers wait for in-flight commits
+        self._commit_lock = threading.Lock()
+        self._write_timer: Optional[threading.Timer] = None
         
-        # Fact Sheet (Semantic Memory) persistence
-        self.fact_sheet_path = os.path.join(base_dir, "fact_sheet.json")
-        self.fact_sheet = self._load_fact_sheet()
-        self._migrate_fact_sheet()
+        # Fact Sheet (Semantic Memory) persistence: one SQLite row per fact.
+        # fact_sheet.json is only read once, to import facts saved by older versions.
+        self.fact_sheet_path = os.path.join(base_dir, "fact_sheet.json") if base_dir is not None else None
+        self.fact_store = FactStore(os.path.join(base_dir, "fact_sheet.db") if base_dir is not None else ":memory:")
+        # Guards fact sheet mutation against the background flush
+        self._lock = threading.RLock()
+        self._dirty_topics = set()
+        # Facts whose last_accessed changed; persisted with the next write or at exit
+        self._touched_topics = set()
+        self._save_timer: Optional[threading.Timer] = None
+        atexit.register(self.flush)
+        self.fact_sheet, imported = self._load_fact_sheet()
+        # Digests of every content version a topic absorbed (oldest first); internal, not fact metadata
+        self._content_hashes: Dict[str, List[str]] = self.fact_store.load_content_hashes()
+        # Bumped whenever fact content changes so readers can cache derived indexes
+        self.fact_sheet_version = 0
+        self._context_cache: Optional[tuple] = None  # (fact_sheet_version, rendered text)
+        if imported or self.fact_store.schema_version < FACT_SCHEMA_VERSION:
+            if self._migrate_fact_sheet() or imported:
+                self._save_fact_sheet()
+            self.fact_store.schema_version = FACT_SCHEMA_VERSION
+        # Lowercased search fields per topic, kept in sync on every write
+        self._search_fields: Dict[str, Dict] = {}
+        # Inverted index: lowercased entity -> topics mentioning it (dict keys as an ordered set)
+        self._entity_index: Dict[str, Dict[str, None]] = defaultdict(dict)
+        for topic in self.fact_sheet:
+            self._normalize(topic)
 
-    def _load_fact_sheet(self) -> Dict:
-        if os.path.exists(self.fact_sheet_path):
-            try:
-                with open(self.fact_sheet_path, "r", encoding="utf-8") as f:
-                    return json.load(f)
-            except Exception:
-                return {}
-        return {}
+    @property
+    def embedding_fn(self):
+        """Shared embedding function for the configured backend, loaded on first access"""
+        if self._embedding_fn is None:
+            with self._chroma_lock:
+                if self._embedding_fn is None:
+                    try:
+                        from src.memory_mcp.embeddings import build_embedding_fn
+                    except ImportError:
+                        from embeddings import build_embedding_fn
+                    self._embedding_fn = build_embedding_fn(self.embedding_backend, self.embedding_model)
+        return self._embedding_fn
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._chroma_lock:
+                if self._client is None:
+                    import chromadb
+                    from chromadb.config import Settings
+                    # No telemetry events are posted from a local memory store
+                    settings = Settings(anonymized_telemetry=False)
+                    if self.chroma_path is None:
+                        self._client = chromadb.EphemeralClient(settings=settings)
+                    else:
+                        self._client = chromadb.PersistentClient(path=self.chroma_path, settings=settings)
+        return self._client
+
+    @property
+    def collection(self):
+        """The episodic memory collection, opened on first access"""
+        if self._collection is None:
+            with self._chroma_lock:
+                if self._collection is None:
+                    self._collection = self._open_collection()
+        return self._collection
+
+    def _open_collection(self):
+        # Graph parameters apply when the collection is created; ef_search is also retuned on open
+        hnsw = dict(config.get("embedding.hnsw") or {})
+        configuration = {"hnsw": hnsw} if hnsw else None
+        # Every add and query passes vectors from self.embed, so Chroma never embeds anything.
+        # Opening without an embedding function also accepts plain callables (no .name()) and
+        # collections persisted under another backend's embedding function.
+        collection = self.client.get_or_create_collection(
+            name=self.collection_name, embedding_function=None, configuration=configuration
+        )
+        ef_search = hnsw.get("ef_search")
+        if ef_search and (collection.configuration.get("hnsw") or {}).get("ef_search") != ef_search:
+            collection.modify(configuration={"hnsw": {"ef_search": ef_search}})
+        return collection
+
+    def _load_fact_sheet(self) -> tuple:
+        """Return (fact sheet, whether it was imported from the legacy JSON file)"""
+        facts = self.fact_store.load_all()
+        if facts or self.fact_sheet_path is None or not os.path.exists(self.fact_sheet_path):
+            return facts, False
+        try:
+            return json_utils.load_file(self.fact_sheet_path), True
+        except Exception:
+            return {}, False
 
     def _save_fact_sheet(self):
-        with open(self.fact_sheet_path, "w", encoding="utf-8") as f:
-            json.dump(self.fact_sheet, f, ensure_ascii=False, indent=2)
+        """Write every fact to SQLite (used after migration/import)"""
+        with self._lock:
+            rows = [(topic, data, self._content_hashes.get(topic, []))
+                    for topic, data in self.fact_sheet.items() if isinstance(data, dict)]
+            self._dirty_topics.clear()
+        self.fact_store.upsert_many(rows)
+
+    def _schedule_save(self, topic: str):
+        """Mark a fact dirty and commit pending facts once the debounce window closes"""
+        with self._lock:
+            self._dirty_topics.add(topic)
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(SAVE_DEBOUNCE_SECONDS, self._flush_facts)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+    def flush(self):
+        """Write pending memories and fact changes now"""
+        self.flush_memories()
+        self._flush_facts()
+
+    def _flush_facts(self):
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            if not self._dirty_topics and not self._touched_topics:
+                return
+            rows = [(topic, self.fact_sheet[topic], self._content_hashes.get(topic, []))
+                    for topic in self._dirty_topics | self._touched_topics]
+            self._dirty_topics = set()
+            self._touched_topics = set()
+            # Rows are serialized inside the store's transaction; hold the lock so
+            # concurrent writers cannot change a fact mid-serialization
+            self.fact_store.upsert_many(rows)
 
-    def _migrate_fact_sheet(self):
-        """Ensure all facts have the new metadata structure"""
+    def close(self):
+        """Write everything pending and release the SQLite and Chroma handles"""
+        self.flush()
+        self.save_embeddings()
+        atexit.unregister(self.flush)
+        atexit.unregister(self.save_embeddings)
+        self.fact_store.close()
+        with self._chroma_lock:
+            if self.chroma_path is None and self._collection is not None:
+                # Nothing else can reach an in-memory store's collection; free it
+                self._client.delete_collection(self.collection_name)
+            self._collection = None
+            self._client = None
+
+    def _migrate_fact_sheet(self) -> bool:
+        """Ensure all facts have the new metadata structure; returns True if anything changed"""
         modified = False
         now = datetime.now().isoformat()
         
@@ -70,60 +308,127 @@ class MemoryStore:
                 meta = data["metadata"]
                 if "importance_score" not in meta:
                     meta["importance_score"] = 0.5
+                    modified = True
                 if "created_at" not in meta:
                     meta["created_at"] = meta.get("updated_at", now)
+                    modified = True
                 if "last_accessed" not in meta:
                     meta["last_accessed"] = meta.get("updated_at", now)
-                modified = True
+                    modified = True
+                if "content_hashes" in meta:
+                    # Earlier versions kept these in the (user-facing) metadata
+                    hashes = self._content_hashes.get(topic, []) + list(meta.pop("content_hashes") or [])
+                    self._content_hashes[topic] = list(dict.fromkeys(hashes))[-MAX_CONTENT_HASHES:]
+                    modified = True
         
         if modified:
-            self._save_fact_sheet()
+            self.fact_sheet_version += 1
+        return modified
+
+    def _normalize(self, topic: str):
+        """Precompute lowercased topic, content and entities so queries never re-lowercase"""
+        data = self.fact_sheet[topic]
+        meta = data.get("metadata", {})
+        entities_lc = tuple(e.lower() for e in meta.get("entities") or [])
+
+        previous = self._search_fields.get(topic)
+        if previous is not None:
+            for entity_lc in set(previous["entities_lc"]) - set(entities_lc):
+                topics = self._entity_index.get(entity_lc)
+                if topics is not None:
+                    topics.pop(topic, None)
+                    if not topics:
+                        del self._entity_index[entity_lc]
+        for entity_lc in entities_lc:
+            self._entity_index[entity_lc][topic] = None
 
-    def update_fact(self, topic: str, content: str, metadata: Optional[Dict] = None):
-        """Update a fact with optional metadata and cognitive tracking"""
+        self._search_fields[topic] = {
+            "topic_lc": topic.lower(),
+            "content_lc": data.get("content", "").lower(),
+            "entities_lc": entities_lc,
+            "content_hashes": frozenset(self._content_hashes.get(topic, ()))
+        }
+
+    def has_seen_content(self, topic: str, content: str) -> bool:
+        """True if this exact content was already integrated into the topic"""
+        fields = self._search_fields.get(topic)
+        return fields is not None and content_digest(content) in fields["content_hashes"]
+
+    def search_snapshot(self) -> tuple:
+        """
+        (fact_sheet_version, [(topic, lowercased search fields, fact)]) taken under the fact lock,
+        so readers on other threads can iterate it while facts are being written.
+        """
+        with self._lock:
+            return self.fact_sheet_version, [
+                (topic, fields, self.fact_sheet[topic]) for topic, fields in self._search_fields.items()
+            ]
+
+    def update_fact(self, topic: str, content: str, metadata: Optional[Dict] = None,
+                    source_content: Optional[str] = None):
+        """
+        Update a fact with optional metadata and cognitive tracking.
+        `source_content` is the raw statement a resolved fact came from, so repeats are recognised later.
+        """
         now = datetime.now().isoformat()
         
         if metadata is None:
             metadata = {}
         
-        # Merge existing metadata if topic exists
-        existing = self.fact_sheet.get(topic)
-        if isinstance(existing, dict) and "metadata" in existing:
-            base_meta = existing["metadata"]
-            # Preserve created_at
-            metadata["created_at"] = base_meta.get("created_at", now)
-        else:
-            metadata["created_at"] = now
+        # Concurrent writers (e.g. parallel consolidation) must not interleave merges of the same topic
+        with self._lock:
+            # Merge existing metadata if topic exists
+            existing = self.fact_sheet.get(topic)
+            if isinstance(existing, dict) and "metadata" in existing:
+                base_meta = existing["metadata"]
+                # Preserve created_at
+                metadata["created_at"] = base_meta.get("created_at", now)
+            else:
+                metadata["created_at"] = now
 
-        # Update importance and timestamps
-        metadata["updated_at"] = now
-        metadata["last_accessed"] = now
-        if "importance_score" not in metadata:
-            metadata["importance_score"] = 0.5
+            # Remember every content version this topic has absorbed
+            seen = self._content_hashes.get(topic, [])
+            if source_content:
+                seen = seen + [content_digest(source_content)]
+            seen = seen + [content_digest(content)]
+            self._content_hashes[topic] = list(dict.fromkeys(seen))[-MAX_CONTENT_HASHES:]
+
+            # Update importance and timestamps
+            metadata["updated_at"] = now
+            metadata["last_accessed"] = now
+            if "importance_score" not in metadata:
+                metadata["importance_score"] = 0.5
             
-        self.fact_sheet[topic] = {
-            "content": content,
-            "metadata": metadata
-        }
-        
-        self._save_fact_sheet()
+            self.fact_sheet[topic] = {
+                "content": content,
+                "metadata": metadata
+            }
+            self._normalize(topic)
+            self.fact_sheet_version += 1
+        self._schedule_save(topic)
     
-    def update_fact_with_metadata(self, topic: str, content: str, entities: List[str] = None, category: str = None, importance: float = 0.5):
+    def update_fact_with_metadata(self, topic: str, content: str, entities: List[str] = None, category: str = None,
+                                  importance: float = 0.5, source_content: Optional[str] = None):
         """Update a fact with full metadata from Agents"""
         metadata = {
             "entities": entities or [],
             "category": category,
             "importance_score": importance
         }
-        self.update_fact(topic, content, metadata)
+        self.update_fact(topic, content, metadata, source_content=source_content)
     
+    def _touch(self, topic: str, now: str):
+        """Record an access in memory only; reads never trigger a write of their own"""
+        with self._lock:
+            self.fact_sheet[topic]["metadata"]["last_accessed"] = now
+            self._touched_topics.add(topic)
+
     def get_fact(self, topic: str) -> Optional[Dict]:
         """Get a fact and update its access timestamp"""
         if topic in self.fact_sheet:
             fact = self.fact_sheet[topic]
             if isinstance(fact, dict) and "metadata" in fact:
-                fact["metadata"]["last_accessed"] = datetime.now().isoformat()
-                self._save_fact_sheet()
+                self._touch(topic, datetime.now().isoformat())
             return fact
         return None
 
@@ -131,78 +436,243 @@ class MemoryStore:
         """Retrieve all facts that mention a specific entity (updates access timestamps)"""
         matching_facts = []
         now = datetime.now().isoformat()
-        modified = False
-        
-        for topic, fact_data in self.fact_sheet.items():
-            if isinstance(fact_data, dict):
-                entities = fact_data.get("metadata", {}).get("entities", [])
-                if entity.lower() in [e.lower() for e in entities]:
-                    fact_data["metadata"]["last_accessed"] = now
-                    modified = True
-                    matching_facts.append({
-                        "topic": topic,
-                        "content": fact_data.get("content", ""),
-                        "entities": entities,
-                        "category": fact_data.get("metadata", {}).get("category", "unknown"),
-                        "importance": fact_data.get("metadata", {}).get("importance_score", 0.5)
-                    })
+        # Snapshot under the lock; a concurrent fact update mutates the index lists
+        with self._lock:
+            topics = list(self._entity_index.get(entity.lower(), ()))
         
-        if modified:
-            self._save_fact_sheet()
+        for topic in topics:
+            fact_data = self.fact_sheet.get(topic)
+            if fact_data is None:
+                continue
+            metadata = fact_data.get("metadata", {})
+            self._touch(topic, now)
+            matching_facts.append({
+                "topic": topic,
+                "content": fact_data.get("content", ""),
+                "entities": metadata.get("entities", []),
+                "category": metadata.get("category", "unknown"),
+                "importance": metadata.get("importance_score", 0.5)
+            })
         return matching_facts
 
-    def get_fact_sheet(self) -> Dict:
+    def get_fact_sheet(self, version_hint: Optional[int] = None) -> Optional[Dict]:
+        """Return the fact sheet, or None if it is unchanged since `version_hint`"""
+        if version_hint is not None and version_hint == self.fact_sheet_version:
+            return None
         return self.fact_sheet
 
-    def add_memory(self, content: str, metadata: Optional[Dict] = None) -> str:
-        """Add episodic memory with importance tracking"""
-        memory_id = str(uuid.uuid4())
+    def render_context(self) -> str:
+        """Fact sheet as the memory://context text; re-rendered only after a fact changes"""
+        cached = self._context_cache
+        if cached is not None and cached[0] == self.fact_sheet_version:
+            return cached[1]
+        with self._lock:
+            version = self.fact_sheet_version
+            if not self.fact_sheet:
+                text = "No structured facts stored yet."
+            else:
+                fact_str = "\n".join(
+                    f"- {topic}: {data.get('content') if isinstance(data, dict) else data}"
+                    for topic, data in self.fact_sheet.items()
+                )
+                text = f"--- SEMANTIC MEMORY ---\n{fact_str}"
+        self._context_cache = (version, text)
+        return text
+
+    def _load_embeddings(self) -> OrderedDict:
+        """Embedding cache saved by a previous run, if it was made with the same model"""
+        cache = OrderedDict()
+        if self.embedding_cache_path is None or not os.path.exists(self.embedding_cache_path):
+            return cache
+        try:
+            with np.load(self.embedding_cache_path, allow_pickle=False) as data:
+                if str(data["model"]) != self.embedding_model_id:
+                    return cache
+                vectors = data["vectors"]
+                vectors.setflags(write=False)
+                cache.update(zip((str(key) for key in data["keys"]), vectors))
+        except Exception:
+            return OrderedDict()
+        return cache
+
+    def save_embeddings(self):
+        """Persist the embedding cache (least recently used first, so order survives restarts)"""
+        with self._embed_lock:
+            if self.embedding_cache_path is None or not self._embeddings_dirty or not self._embeddings:
+                return
+            keys = np.array(list(self._embeddings))
+            vectors = np.stack(list(self._embeddings.values()))
+            self._embeddings_dirty = False
+        np.savez(self.embedding_cache_path, keys=keys, vectors=vectors, model=np.array(self.embedding_model_id))
+
+    def embed(self, text: str) -> np.ndarray:
+        """Embedding of `text`; memoized, so classify/store/search of one message embed it once"""
+        return self.embed_many([text])[0]
+
+    def embed_many(self, texts: List[str]) -> List[np.ndarray]:
+        """
+        Batch form of embed() with the embedding-function call signature.
+        Uncached texts go through the model in a single call.
+        """
+        digests = [content_digest(text) for text in texts]
+        with self._embed_lock:
+            found = {d: self._embeddings[d] for d in digests if d in self._embeddings}
+        missing = {d: text for d, text in zip(digests, texts) if d not in found}
+        if missing:
+            vectors = np.asarray(self.embedding_fn(list(missing.values())), dtype=np.float32)
+            vectors.setflags(write=False)  # rows are shared by every caller of the cache
+            found.update(zip(missing, vectors))
+        with self._embed_lock:
+            for digest, vector in found.items():
+                self._embeddings[digest] = vector
+                self._embeddings.move_to_end(digest)
+            while len(self._embeddings) > self.embedding_cache_size:
+                self._embeddings.popitem(last=False)
+            if missing:
+                self._embeddings_dirty = True
+        return [found[digest] for digest in digests]
+
+    def add_memory(self, content: str, metadata: Optional[Dict] = None, embedding: Optional[List[float]] = None) -> str:
+        """
+        Add episodic memory with importance tracking.
+        A precomputed `embedding` (or a cached one) is passed to Chroma so it skips its embedding function.
+        """
+        embeddings = None if embedding is None else [embedding]
+        return self.add_memories([content], [metadata], embeddings)[0]
+
+    def add_memories(self, contents: List[str], metadatas: Optional[List[Optional[Dict]]] = None,
+                     embeddings: Optional[List] = None) -> List[str]:
+        """
+        Queue episodic memories and return their ids.
+        The queue is committed with one embedding call and one Chroma write once it holds
+        `max_batch` items or `write_window` seconds pass; reads flush it first.
+        """
+        if not contents:
+            return []
+        ids = [new_memory_id() for _ in contents]
         now = datetime.now().isoformat()
-        
-        if metadata is None:
-            metadata = {}
-        
-        metadata["created_at"] = now
-        metadata["last_accessed"] = now
-        if "importance_score" not in metadata:
-            metadata["importance_score"] = 0.5
-            
-        self.collection.add(
-            documents=[content],
-            metadatas=[metadata],
-            ids=[memory_id]
-        )
-        return memory_id
+        metadatas = metadatas or [None] * len(contents)
+        embeddings = embeddings or [None] * len(contents)
+
+        with self._pending_lock:
+            for memory_id, content, metadata, embedding in zip(ids, contents, metadatas, embeddings):
+                metadata = metadata if metadata is not None else {}
+                metadata["created_at"] = now
+                metadata["last_accessed"] = now
+                if "importance_score" not in metadata:
+                    metadata["importance_score"] = 0.5
+                self._pending.append((memory_id, content, metadata, embedding))
+            full = len(self._pending) >= self.max_batch
+            if not full:
+                self._schedule_memory_flush()
+        if full:
+            self.flush_memories()
+        return ids
+
+    def _schedule_memory_flush(self):
+        # Caller holds _pending_lock
+        if self._write_timer is None:
+            self._write_timer = threading.Timer(self.write_window, self._flush_in_background)
+            self._write_timer.daemon = True
+            self._write_timer.start()
+
+    def _flush_in_background(self):
+        try:
+            self.flush_memories()
+        except Exception as e:
+            # The batch is back in the queue; the next write, read or flush retries it
+            logger.error("Background memory commit failed: %s", e)
+
+    def flush_memories(self):
+        """
+        Commit queued episodic memories and access timestamps to Chroma.
+        Returns once everything queued before the call is written, including batches a
+        concurrent flush had already taken; a failed batch is re-queued and the error raised.
+        """
+        with self._commit_lock:
+            with self._pending_lock:
+                if self._write_timer is not None:
+                    self._write_timer.cancel()
+                    self._write_timer = None
+                batch, self._pending = self._pending, []
+                accessed, self._accessed = self._accessed, {}
+
+            try:
+                if batch:
+                    ids, contents, metadatas, embeddings = (list(column) for column in zip(*batch))
+                    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+                    if missing:
+                        for i, vector in zip(missing, self.embed_many([contents[i] for i in missing])):
+                            embeddings[i] = vector
+                    self.collection.add(
+                        documents=contents,
+                        embeddings=embeddings,
+                        metadatas=metadatas,
+                        ids=ids
+                    )
+                    batch = []
+                if accessed:
+                    # Chroma merges metadata keys on update, so only the timestamp is sent
+                    self.collection.update(
+                        ids=list(accessed),
+                        metadatas=[{"last_accessed": ts} for ts in accessed.values()]
+                    )
+            except Exception:
+                with self._pending_lock:
+                    # Oldest first, ahead of anything queued meanwhile; newer timestamps win
+                    self._pending[:0] = batch
+                    self._accessed = {**accessed, **self._accessed}
+                logger.error("Failed to commit %s memories; re-queued", len(batch))
+                raise
 
     def search_memory(self, query: str, limit: int = 5) -> List[Dict]:
-        """Search episodic memories and update access timestamps"""
+        """
+        Search episodic memories and update access timestamps.
+        With mmr_lambda < 1, 4x `limit` neighbours are reranked by MMR so near-duplicates don't crowd out other results.
+        """
+        # Also waits for a batch a background flush is still writing
+        self.flush_memories()
+        # An empty store (fresh install, after delete_all) can't match; skip embedding the query
+        if self.collection.count() == 0:
+            return []
+        query_vector = self.embed(query)
+        use_mmr = self.mmr_lambda < 1
         results = self.collection.query(
-            query_texts=[query],
-            n_results=limit
+            query_embeddings=[query_vector],
+            n_results=limit * 4 if use_mmr else limit,
+            include=["documents", "metadatas", "embeddings"] if use_mmr else ["documents", "metadatas"]
         )
         
         memories = []
-        if results["documents"]:
+        if results["documents"] and results["documents"][0]:
+            order = range(len(results["documents"][0]))
+            if use_mmr:
+                order = mmr_select(query_vector, np.asarray(results["embeddings"][0], dtype=np.float32),
+                                   limit, self.mmr_lambda)
             now = datetime.now().isoformat()
-            for i, doc in enumerate(results["documents"][0]):
+            for i in order:
+                doc = results["documents"][0][i]
                 meta = results["metadatas"][0][i] if results["metadatas"] else {}
                 mem_id = results["ids"][0][i]
-                
-                # Update last_accessed in ChromaDB (requires update call)
                 meta["last_accessed"] = now
-                self.collection.update(ids=[mem_id], metadatas=[meta])
-                
                 memories.append({
                     "content": doc,
                     "metadata": meta,
                     "id": mem_id
                 })
+            # Access timestamps are persisted in one batched update, off the read path
+            with self._pending_lock:
+                self._accessed.update((memory["id"], now) for memory in memories)
+                self._schedule_memory_flush()
         return memories
 
     def delete_memory(self, memory_id: str):
+        self.flush_memories()
         self.collection.delete(ids=[memory_id])
 
     def delete_all(self):
+        self.flush_memories()
         ids = self.collection.get()['ids']
         if ids:
             self.collection.delete(ids=ids)
+
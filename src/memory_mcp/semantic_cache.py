@@ -0,0 +1,145 @@
+"""
+Embedding-keyed cache for LLM classifications.
+Near-duplicate messages ("thanks!", "thank you", "I prefer dark mode" vs
+"I like dark mode") are answered from the closest previous result instead
+of another round-trip to Gemini/Ollama.
+"""
+import atexit
+import logging
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from src.memory_mcp.config import config
+    from src.memory_mcp import json_utils
+except ImportError:
+    from config import config
+    import json_utils
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticCache:
+    """
+    Nearest-neighbour cache over normalized message embeddings.
+    A few thousand 384-dim rows fit in one float32 matrix, so lookup is a single
+    matrix-vector product; no ANN index is needed at this size.
+    Entries are appended to a JSONL file as they are added; when full, the entry
+    with the fewest hits is evicted.
+    """
+
+    def __init__(self, embedding_fn: Callable, filename: str, base_dir: Optional[str] = None,
+                 threshold: float = 0.95, max_size: int = 2048):
+        if base_dir is None:
+            base_dir = config.data_dir
+        os.makedirs(base_dir, exist_ok=True)
+        self.path = os.path.join(base_dir, filename)
+        self.embedding_fn = embedding_fn
+        self.threshold = threshold
+        self.max_size = max_size
+        self._vectors: Optional[np.ndarray] = None
+        self._values: List[Dict] = []
+        self._hit_counts: List[int] = []
+        self._needs_compaction = False
+        self.hits = 0
+        self.misses = 0
+        self._load()
+        atexit.register(self.save)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        rows = []
+        try:
+            with open(self.path, "rb") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        rows.append(json_utils.loads(line))
+        except Exception as e:
+            logger.error("Failed to load semantic cache %s: %s", self.path, e)
+            return
+        if len(rows) > self.max_size:
+            rows = rows[-self.max_size:]
+            self._needs_compaction = True
+        if rows:
+            self._vectors = np.array([r["vector"] for r in rows], dtype=np.float32)
+            self._values = [r["value"] for r in rows]
+            self._hit_counts = [r.get("hits", 0) for r in rows]
+
+    def embed(self, text: str) -> np.ndarray:
+        """L2-normalized float32 embedding of `text`"""
+        vector = np.asarray(self.embedding_fn([text])[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, vector: np.ndarray) -> Tuple[Optional[Dict], float]:
+        """Return (cached value, similarity) of the nearest entry, or (None, best similarity) on a miss"""
+        if self._vectors is None or not len(self._values):
+            self.misses += 1
+            return None, 0.0
+        similarities = self._vectors @ vector
+        best = int(np.argmax(similarities))
+        similarity = float(similarities[best])
+        if similarity < self.threshold:
+            self.misses += 1
+            return None, similarity
+        self.hits += 1
+        self._hit_counts[best] += 1
+        return dict(self._values[best]), similarity
+
+    def add(self, vector: np.ndarray, value: Dict):
+        row = np.asarray(vector, dtype=np.float32)[None, :]
+        if len(self._values) >= self.max_size:
+            # Evict the least useful entry (fewest hits, oldest first on ties)
+            victim = int(np.argmin(self._hit_counts))
+            self._vectors = np.delete(self._vectors, victim, axis=0)
+            del self._values[victim]
+            del self._hit_counts[victim]
+            self._needs_compaction = True
+        self._vectors = row if self._vectors is None else np.vstack([self._vectors, row])
+        self._values.append(value)
+        self._hit_counts.append(0)
+        if not self._needs_compaction:
+            self._append(row[0], value, 0)
+
+    def training_data(self) -> Tuple[np.ndarray, List[Dict]]:
+        """All cached (embedding, value) pairs, e.g. to distil a local classifier"""
+        if self._vectors is None:
+            return np.zeros((0, 0), dtype=np.float32), []
+        return self._vectors.copy(), [dict(v) for v in self._values]
+
+    def _append(self, vector: np.ndarray, value: Dict, hits: int):
+        try:
+            with open(self.path, "ab") as f:
+                f.write(json_utils.dumps({"vector": vector.tolist(), "value": value, "hits": hits}) + b"\n")
+        except Exception as e:
+            logger.error("Failed to append to semantic cache %s: %s", self.path, e)
+
+    def save(self):
+        """Rewrite the JSONL file after evictions so it matches the in-memory entries"""
+        if not self._needs_compaction:
+            return
+        try:
+            with open(self.path, "wb") as f:
+                for vector, value, hits in zip(self._vectors, self._values, self._hit_counts):
+                    f.write(json_utils.dumps({"vector": vector.tolist(), "value": value, "hits": hits}) + b"\n")
+            self._needs_compaction = False
+        except Exception as e:
+            logger.error("Failed to save semantic cache %s: %s", self.path, e)
+
+    def close(self):
+        """Save now and drop the exit hook, so a replaced cache can't overwrite its successor's file"""
+        self.save()
+        atexit.unregister(self.save)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._values),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
@@ -1,7 +1,7 @@
 from mcp.server.fastmcp import FastMCP, Context
 from mcp.types import Tool, TextContent, ImageContent, EmbeddedResource
-from typing import List, Dict, Union, Optional
-import json
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Dict, Union, Optional
 import logging
 import asyncio
 import os
@@ -11,30 +11,63 @@ import time
 try:
     from src.memory_mcp.memory_store import MemoryStore
     from src.memory_mcp.agents.grounder import GroundingAgent
-    from src.memory_mcp.agents.monitor import MonitorAgent
+    from src.memory_mcp.agents.monitor import MonitorAgent, CoalescingMonitor
     from src.memory_mcp.agents.extractor import ExtractionAgent
     from src.memory_mcp.agents.reflector import ReflectorAgent
     from src.memory_mcp.config import config
+    from src.memory_mcp import json_utils
 except ImportError:
     from memory_mcp.memory_store import MemoryStore
     from memory_mcp.agents.grounder import GroundingAgent
-    from memory_mcp.agents.monitor import MonitorAgent
+    from memory_mcp.agents.monitor import MonitorAgent, CoalescingMonitor
     from memory_mcp.agents.extractor import ExtractionAgent
     from memory_mcp.agents.reflector import ReflectorAgent
     from memory_mcp.config import config
+    from memory_mcp import json_utils
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize Server
-mcp = FastMCP("memory-server")
+# Storage & Agents, built by configure(): on server startup, or earlier by an embedder.
+# Nothing is constructed at import, so importing this module touches no data directory
+# and starts no model warm-up.
+memory_store: Optional[MemoryStore] = None
+grounding_agent: Optional[GroundingAgent] = None
+monitor_agent: Optional[CoalescingMonitor] = None
+extraction_agent: Optional[ExtractionAgent] = None
+reflector_agent: Optional[ReflectorAgent] = None
+
+
+def configure(home: Optional[str] = None):
+    """
+    (Re)build the memory store and every agent, with all data and caches under `home`
+    (default: config.data_dir). The previous store and agents are flushed and closed first,
+    so the new ones load their latest data and stale caches never write at exit.
+    """
+    global memory_store, grounding_agent, monitor_agent, extraction_agent, reflector_agent
+    if monitor_agent is not None:
+        monitor_agent.close()
+    if extraction_agent is not None:
+        extraction_agent.close()
+    if memory_store is not None:
+        memory_store.close()
+    memory_store = MemoryStore(path=os.path.join(home, "chroma_db") if home else None)
+    grounding_agent = GroundingAgent(memory_store)
+    monitor_agent = CoalescingMonitor(MonitorAgent(embedding_fn=memory_store.embed_many, base_dir=home))
+    extraction_agent = ExtractionAgent(base_dir=home)
+    reflector_agent = ReflectorAgent()
+
+
+@asynccontextmanager
+async def lifespan(server: FastMCP) -> AsyncIterator[None]:
+    """Build the store and agents when the server starts, unless configure() already ran"""
+    if memory_store is None:
+        configure()
+    yield
+
 
-# Initialize Storage & Agents
-memory_store = MemoryStore()
-grounding_agent = GroundingAgent(memory_store)
-monitor_agent = MonitorAgent()
-extraction_agent = ExtractionAgent()
-reflector_agent = ReflectorAgent()
+# Initialize Server
+mcp = FastMCP("memory-server", lifespan=lifespan)
 
 # Automation State
 MESSAGE_COUNTER = 0
@@ -51,14 +84,14 @@ async def run_maintenance_loop():
         logger.info("Background maintenance loop is disabled via config.")
         return
 
-    logger.info(f"Background maintenance loop started. Interval: {interval}s")
+    logger.info("Background maintenance loop started. Interval: %ss", interval)
     while True:
         try:
             logger.info("Starting scheduled background reflection cycle...")
-            await reflector_agent.reflect(memory_store)
-            logger.info(f"Background reflection complete. Sleeping for {interval}s")
+            await reflector_agent.reflect(memory_store, monitor=monitor_agent)
+            logger.info("Background reflection complete. Sleeping for %ss", interval)
         except Exception as e:
-            logger.error(f"Error in maintenance loop: {e}")
+            logger.error("Error in maintenance loop: %s", e)
         
         await asyncio.sleep(interval)
 
@@ -66,22 +99,34 @@ async def run_maintenance_loop():
 # but FastMCP handles the event loop inside mcp.run().
 # For now, we remove the invalid decorator to allow connection.
 
+def _commit_memories(contents: List[str], metas: List[Dict]) -> List[str]:
+    """
+    Queue memories and commit the queue (with anything concurrent tool calls queued), so a
+    tool only reports memories that are persisted. Embedding blocks; run it off the event loop.
+    """
+    memory_ids = memory_store.add_memories(contents, metas)
+    memory_store.flush_memories()
+    return memory_ids
+
 @mcp.resource("memory://context")
 def get_context() -> str:
     """Get summarized semantic memory context."""
-    facts = memory_store.get_fact_sheet()
-    if not facts:
-        return "No structured facts stored yet."
-    fact_str = "\n".join([f"- {topic}: {data.get('content') if isinstance(data, dict) else data}" for topic, data in facts.items()])
-    return f"--- SEMANTIC MEMORY ---\n{fact_str}"
+    return memory_store.render_context()
 
 @mcp.tool()
-def store_memory(content: str, importance: float = 0.5) -> str:
+async def store_memory(content: str, importance: float = 0.5) -> str:
     """Store raw episodic memory with importance tracking."""
     meta = {"importance_score": importance, "source": "manual"}
-    memory_id = memory_store.add_memory(content, meta)
+    memory_id = (await asyncio.to_thread(_commit_memories, [content], [meta]))[0]
     return f"Episodic memory stored | ID: {memory_id} | Importance: {importance}"
 
+@mcp.tool()
+async def store_memories(contents: List[str], importance: float = 0.5) -> str:
+    """Store several episodic memories at once (embedded in one batch and committed in one write)."""
+    metas = [{"importance_score": importance, "source": "manual"} for _ in contents]
+    memory_ids = await asyncio.to_thread(_commit_memories, contents, metas)
+    return f"{len(memory_ids)} episodic memories stored | IDs: {', '.join(memory_ids)} | Importance: {importance}"
+
 @mcp.tool()
 def update_fact(topic: str, content: str, importance: float = 0.8) -> str:
     """Manually update the semantic fact sheet."""
@@ -102,22 +147,29 @@ async def process_message(message: str, context: Optional[list] = None) -> str:
         return "Message classified as chitchat. No action taken."
     
     # 2. Extract
-    extraction = extraction_agent.extract_facts(message, classification.get("category", "fact"), context)
+    extraction = await extraction_agent.extract_facts_async(message, classification.get("category", "fact"), context)
     topic = extraction.get("topic")
     content = extraction.get("content")
     
     # 3. Conflict Resolution & Store
     existing = memory_store.get_fact(topic)
-    if existing:
-        logger.info(f"Conflict detected for topic: {topic}. Resolving...")
+    extracted_content = content
+    resolved = False
+    if existing and memory_store.has_seen_content(topic, content):
+        # Already integrated into this topic; no need to ask the LLM to reconcile again
+        content = existing.get("content")
+    elif existing:
+        logger.info("Conflict detected for topic: %s. Resolving...", topic)
         content = await extraction_agent.resolve_conflict(content, existing.get("content"))
+        resolved = True
     
     memory_store.update_fact_with_metadata(
         topic=topic,
         content=content,
         entities=extraction.get("entities"),
         category=extraction.get("category"),
-        importance=classification.get("importance_score", 0.5)
+        importance=classification.get("importance_score", 0.5),
+        source_content=extracted_content
     )
     
     # 4. Turn-based automation check
@@ -128,28 +180,29 @@ async def process_message(message: str, context: Optional[list] = None) -> str:
     threshold = config.get("reflector.message_threshold", 20)
     
     if MESSAGE_COUNTER >= threshold:
-        logger.info(f"Threshold reached ({MESSAGE_COUNTER}/{threshold}). Triggering turn-based reflection...")
-        asyncio.create_task(reflector_agent.reflect(memory_store))
+        logger.info("Threshold reached (%s/%s). Triggering turn-based reflection...", MESSAGE_COUNTER, threshold)
+        asyncio.create_task(reflector_agent.reflect(memory_store, monitor=monitor_agent))
         MESSAGE_COUNTER = 0
         maintenance_status = f" | [Self-Maintenance Triggered (Threshold: {threshold})]"
     
-    return f"Knowledge integrated: {topic} | Resolved: {bool(existing)}{maintenance_status}"
+    return f"Knowledge integrated: {topic} | Resolved: {resolved}{maintenance_status}"
 
 @mcp.tool()
 async def reflect_and_consolidate() -> str:
     """Run cognitive reflection cycle manually (merge episodic -> semantic, prune old data)."""
-    await reflector_agent.reflect(memory_store)
+    await reflector_agent.reflect(memory_store, monitor=monitor_agent)
     return "Memory reflection complete. Facts consolidated and database pruned."
 
 @mcp.tool()
-def ground_query(query: str, max_facts: int = 5) -> str:
+async def ground_query(query: str, max_facts: int = 5) -> str:
     """Enrich query with hierarchical context retrieval."""
-    return grounding_agent.enrich_query(query, max_facts=max_facts)
+    # Embedding and the Chroma query block, so other tool calls keep running meanwhile
+    return await asyncio.to_thread(grounding_agent.enrich_query, query, max_facts=max_facts)
 
 @mcp.tool()
 def get_fact_sheet() -> str:
     """Retrieve full semantic fact sheet in JSON format."""
-    return json.dumps(memory_store.get_fact_sheet(), indent=2)
+    return json_utils.dumps(memory_store.get_fact_sheet(), indent=True).decode("utf-8")
 
 if __name__ == "__main__":
     mcp.run()
@@ -0,0 +1,17 @@
+from src.memory_mcp.agents.grounder import GroundingAgent
+from src.memory_mcp.memory_store import MemoryStore
+
+
+class NoModelStore(MemoryStore):
+    @property
+    def embedding_fn(self):
+        raise RuntimeError("model unavailable")
+
+
+def test_keyword_fallback_when_embedding_model_fails():
+    store = NoModelStore(in_memory=True)
+    store.update_fact_with_metadata("Editor", "Uses vim", entities=["vim"])
+
+    facts = GroundingAgent(store).retrieve_relevant_facts("switch vim theme")
+    assert [f["topic"] for f in facts] == ["Editor"]
+    store.close()
@@ -0,0 +1,12 @@
+from src.memory_mcp import json_utils
+
+
+def test_extract_object_restores_brace_eaten_by_stop_sequence():
+    # Ollama stops on "}\n", so the closing brace never reaches us
+    assert json_utils.extract_object('{"important": true, "category": "fact"') == {"important": True, "category": "fact"}
+
+
+def test_extract_object_skips_prose_and_non_objects():
+    assert json_utils.extract_object('Sure! {"topic": "Editor"} and {"topic": "Shell"}') == {"topic": "Editor"}
+    assert json_utils.extract_object("[1, 2]") is None
+    assert json_utils.extract_object("no json here") is None
@@ -0,0 +1,24 @@
+from src.memory_mcp.llm_cache import LLMResponseCache
+
+
+def test_lru_eviction_and_persistence(tmp_path):
+    cache = LLMResponseCache("llm.json", base_dir=str(tmp_path), max_entries=2)
+    cache.put("a", {"n": 1})
+    cache.put("b", {"n": 2})
+    assert cache.get("a") == {"n": 1}  # "a" is now the most recently used
+    cache.put("c", {"n": 3})
+    assert cache.get("b") is None
+    cache.close()
+
+    reloaded = LLMResponseCache("llm.json", base_dir=str(tmp_path), max_entries=2)
+    assert list(reloaded.entries) == ["a", "c"]
+    assert reloaded.get("c") == {"n": 3}
+    reloaded.close()
+
+
+def test_get_returns_a_copy(tmp_path):
+    cache = LLMResponseCache("llm.json", base_dir=str(tmp_path))
+    cache.put("a", {"n": 1})
+    cache.get("a")["n"] = 2
+    assert cache.get("a") == {"n": 1}
+    cache.close()
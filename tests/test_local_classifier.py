@@ -0,0 +1,40 @@
+import numpy as np
+
+from src.memory_mcp.local_classifier import LocalClassifier
+
+FACT = {"important": True, "category": "fact", "importance_score": 0.8}
+CHITCHAT = {"important": False, "category": "chitchat", "importance_score": 0.1}
+
+
+def training_set():
+    rng = np.random.default_rng(0)
+    vectors = np.vstack([rng.normal(1.0, 0.05, (10, 8)), rng.normal(-1.0, 0.05, (10, 8))])
+    return vectors, [FACT] * 10 + [CHITCHAT] * 10
+
+
+def test_fit_predict_and_reload(tmp_path):
+    vectors, labels = training_set()
+    classifier = LocalClassifier(base_dir=str(tmp_path), min_samples=10)
+    assert classifier.predict(vectors[0]) is None
+    assert classifier.fit(vectors, labels)
+
+    prediction = classifier.predict(vectors[0])
+    assert prediction["category"] == "fact" and prediction["important"] is True
+    assert prediction["importance_score"] == 0.8
+
+    reloaded = LocalClassifier(base_dir=str(tmp_path), min_samples=10)
+    assert reloaded.trained
+    assert reloaded.predict(vectors[-1]) == classifier.predict(vectors[-1])
+    assert reloaded.predict(vectors[-1])["category"] == "chitchat"
+
+
+def test_too_little_data_and_low_confidence(tmp_path):
+    vectors, labels = training_set()
+    classifier = LocalClassifier(base_dir=str(tmp_path), min_samples=50)
+    assert not classifier.fit(vectors, labels)
+    assert not classifier.trained
+
+    classifier.min_samples = 10
+    classifier.fit(vectors, labels)
+    # Equidistant from both clusters: not confident enough to answer locally
+    assert classifier.predict(np.zeros(8)) is None
@@ -0,0 +1,81 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+from src.memory_mcp.memory_store import MemoryStore, mmr_select, new_memory_id
+
+
+class HashEmb:
+    """Deterministic stand-in for the embedding model: a plain callable, not a Chroma EmbeddingFunction"""
+
+    def __call__(self, input):
+        return [np.frombuffer(hashlib.blake2b(t.encode(), digest_size=64).digest(), dtype=np.uint8)
+                .astype(np.float32) for t in input]
+
+
+@pytest.fixture
+def store():
+    s = MemoryStore(embedding_function=HashEmb(), in_memory=True)
+    yield s
+    s.close()
+
+
+def test_plain_callable_embedder_round_trip(store):
+    memory_id = store.add_memory("Memory A", {"tag": "A"})
+    store.add_memory("Memory B", {"tag": "B"})
+
+    results = store.search_memory("Memory A", limit=2)
+    assert memory_id in [m["id"] for m in results]
+
+    store.delete_memory(memory_id)
+    assert memory_id not in [m["id"] for m in store.search_memory("Memory A", limit=2)]
+
+    store.delete_all()
+    assert store.search_memory("Memory B") == []
+
+
+def test_failed_commit_is_requeued(store, monkeypatch):
+    store.write_window = 60  # keep the background flush out of the way
+    memory_id = store.add_memory("Memory C")
+    collection = store.collection
+
+    def fail(**kwargs):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(collection, "add", fail)
+    with pytest.raises(RuntimeError):
+        store.flush_memories()
+    monkeypatch.undo()
+
+    store.flush_memories()
+    assert collection.get(ids=[memory_id])["ids"] == [memory_id]
+
+
+def test_content_hashes_stay_out_of_fact_metadata(tmp_path):
+    path = str(tmp_path / "chroma_db")
+    store = MemoryStore(path=path, embedding_function=HashEmb())
+    store.update_fact_with_metadata("Editor", "Uses vim", source_content="I switched to vim")
+    assert "content_hashes" not in store.get_fact_sheet()["Editor"]["metadata"]
+    assert store.has_seen_content("Editor", "I switched to vim")
+    store.close()
+
+    reopened = MemoryStore(path=path, embedding_function=HashEmb())
+    assert reopened.has_seen_content("Editor", "Uses vim")
+    assert reopened.has_seen_content("Editor", "I switched to vim")
+    reopened.close()
+
+
+def test_mmr_prefers_diverse_candidates():
+    query = np.array([1.0, 0.0], dtype=np.float32)
+    candidates = np.array([[1.0, 0.1], [1.0, 0.11], [0.7, -0.7]], dtype=np.float32)
+    # Pure relevance takes the two near-duplicates; MMR swaps the second for the distinct one
+    assert mmr_select(query, candidates, k=2, lam=1.0) == [0, 1]
+    assert mmr_select(query, candidates, k=2, lam=0.5) == [0, 2]
+
+
+def test_memory_ids_are_monotonic_ulids():
+    ids = [new_memory_id() for _ in range(1000)]
+    assert ids == sorted(ids)
+    assert len(set(ids)) == len(ids)
+    assert all(len(i) == 26 for i in ids)
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from src.memory_mcp.agents import monitor as monitor_module
+from src.memory_mcp.agents.monitor import CoalescingMonitor, MonitorAgent, MonitorAgentSync
+
+
+def classification(message):
+    return {"important": True, "category": "fact", "confidence": 0.8, "importance_score": len(message) / 100}
+
+
+@pytest.fixture
+def make_agent(tmp_path, monkeypatch):
+    monkeypatch.setattr(monitor_module, "warm_up_ollama_model", lambda *args, **kwargs: None)
+    agents = []
+
+    def make(cls=MonitorAgent):
+        agent = cls(provider="ollama", model="test-model", base_dir=str(tmp_path))
+        calls = []
+
+        async def fake_ollama(message, context=None):
+            calls.append(message)
+            return classification(message)
+
+        agent._classify_ollama = fake_ollama
+        agent.calls = calls
+        agents.append(agent)
+        return agent
+
+    yield make
+    for agent in agents:
+        agent.cache.save()
+
+
+def test_sync_agent_classify_batch(make_agent):
+    agent = make_agent(MonitorAgentSync)
+    assert agent.classify("I switched to vim") == classification("I switched to vim")
+    results = asyncio.run(agent.classify_batch(["Deadline is Friday", "We deploy on k8s"]))
+    assert results == [classification("Deadline is Friday"), classification("We deploy on k8s")]
+
+
+class BatchRecorder:
+    """Stand-in agent that records each classify_batch burst"""
+
+    def __init__(self, error=None):
+        self.batches = []
+        self.error = error
+        self.closed = False
+
+    async def classify_batch(self, messages):
+        self.batches.append(list(messages))
+        if self.error is not None:
+            raise self.error
+        return [classification(m) for m in messages]
+
+    def close(self):
+        self.closed = True
+
+
+def test_coalescer_batches_concurrent_calls():
+    agent = BatchRecorder()
+    coalescer = CoalescingMonitor(agent, batch_window_ms=20, max_batch=16)
+    messages = ["I use React", "Deadline is Friday", "We deploy on k8s"]
+
+    async def run():
+        return await asyncio.gather(*(coalescer.classify(m) for m in messages))
+
+    assert asyncio.run(run()) == [classification(m) for m in messages]
+    assert agent.batches == [messages]
+
+
+def test_coalescer_propagates_batch_errors():
+    coalescer = CoalescingMonitor(BatchRecorder(error=RuntimeError("LLM down")), batch_window_ms=20)
+
+    async def run():
+        return await asyncio.gather(coalescer.classify("a"), coalescer.classify("b"), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert [type(r) for r in results] == [RuntimeError, RuntimeError]
+    assert str(results[0]) == "LLM down"
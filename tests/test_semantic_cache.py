@@ -0,0 +1,41 @@
+import numpy as np
+
+from src.memory_mcp.semantic_cache import SemanticCache
+
+
+def unit(*values):
+    v = np.array(values, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+def make_cache(tmp_path, **kwargs):
+    return SemanticCache(embedding_fn=None, filename="semantic.jsonl", base_dir=str(tmp_path), **kwargs)
+
+
+def test_hit_above_threshold_miss_below(tmp_path):
+    cache = make_cache(tmp_path, threshold=0.95)
+    assert cache.lookup(unit(1, 0, 0)) == (None, 0.0)
+
+    cache.add(unit(1, 0, 0), {"category": "preference"})
+    value, similarity = cache.lookup(unit(1, 0.1, 0))  # cos ~ 0.995
+    assert value == {"category": "preference"} and similarity > 0.95
+
+    value, similarity = cache.lookup(unit(1, 1, 0))  # cos ~ 0.707
+    assert value is None and similarity < 0.95
+    assert (cache.hits, cache.misses) == (1, 2)
+    cache.close()
+
+
+def test_eviction_and_reload(tmp_path):
+    cache = make_cache(tmp_path, max_size=2)
+    cache.add(unit(1, 0, 0), {"n": 1})
+    cache.add(unit(0, 1, 0), {"n": 2})
+    cache.lookup(unit(1, 0, 0))  # entry 1 now has a hit, so entry 2 is the victim
+    cache.add(unit(0, 0, 1), {"n": 3})
+    cache.close()
+
+    reloaded = make_cache(tmp_path, max_size=2)
+    assert reloaded.lookup(unit(1, 0, 0))[0] == {"n": 1}
+    assert reloaded.lookup(unit(0, 1, 0))[0] is None
+    assert reloaded.lookup(unit(0, 0, 1))[0] == {"n": 3}
+    reloaded.close()